@@ -1,21 +1,25 @@
 import click
 
-# Inmport the user and config commands
-from .user import user_subcommand
-from .config import config_subcommand
-from .task import task_subcommand
-
-
-@click.group()
+from .lazy_group import LazyGroup
+
+
+# The subcommand modules are only imported when the subcommand is invoked, so that
+# e.g. `clenv config checkout` does not import the ClearML SDK used by `clenv task`
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "config": "clenv.cli.config.config_subcommand.config",
+        "user": "clenv.cli.user.user_subcommand.user",
+        "task": "clenv.cli.task.task_subcommand.task",
+        "queue": "clenv.cli.queue.queue_subcommand.queue",
+        "worker": "clenv.cli.worker.worker_subcommand.worker",
+        "daemon": "clenv.cli.daemon.daemon_subcommand.daemon",
+    },
+)
 def clenv():
     pass
 
 
-clenv.add_command(config_subcommand.config)
-clenv.add_command(user_subcommand.user)
-clenv.add_command(task_subcommand.task)
-
-
 def main():
     clenv()
 
@@ -0,0 +1,88 @@
+import os
+import sys
+
+# The API session of the process, shared by the managers. It's the session of the opt-in
+# daemon when the daemon is enabled, the daemon modules are only imported then.
+DAEMON_ENV_VAR = "CLENV_DAEMON"
+
+_daemon_session = None
+_daemon_unavailable = False
+
+
+def is_daemon_enabled(config_loader):
+    """
+    The daemon is enabled by the CLENV_DAEMON environment variable, or by the
+    clenv.daemon.enabled config value
+    """
+    enabled = os.environ.get(DAEMON_ENV_VAR)
+    if enabled is not None:
+        return enabled.lower() not in ("", "0", "false", "no")
+    return bool(config_loader.get_config_value("clenv.daemon.enabled", False))
+
+
+def get_session(config_loader):
+    """
+    Get the API session of the process: the daemon's one if the daemon is enabled,
+    otherwise the in-process shared session, configured by config_loader. The in-process
+    session is also used if the daemon can't be started.
+    """
+    global _daemon_session, _daemon_unavailable
+    if not _daemon_unavailable and is_daemon_enabled(config_loader):
+        if _daemon_session is None:
+            from clenv.cli.daemon.daemon_client import DaemonClient, DaemonSession
+
+            try:
+                _daemon_session = DaemonSession(DaemonClient())
+            except Exception as e:
+                # Not tried again by this process
+                _daemon_unavailable = True
+                print(f"clenv daemon unavailable: {e}", file=sys.stderr)
+        if _daemon_session is not None:
+            return _daemon_session
+
+    from clenv.cli.queue.cached_token_session import get_configured_session
+
+    return get_configured_session(config_loader)
+
+
+def is_daemon_session(session):
+    """
+    Whether the session sends its requests through the daemon
+    """
+    # The session can't be the daemon's one if the daemon client was never imported
+    daemon_client = sys.modules.get("clenv.cli.daemon.daemon_client")
+    return daemon_client is not None and isinstance(
+        session, daemon_client.DaemonSession
+    )
+
+
+def init_sdk_session(config_loader):
+    """
+    Make the in-process shared session, with its cached token and transport settings,
+    the default session of the ClearML SDK. The SDK calls made by the command itself,
+    e.g. populating a task, use it even when the daemon sends the other API calls.
+    """
+    from clenv.cli.queue.cached_token_session import get_configured_session
+
+    get_configured_session(config_loader)
+
+
+# The ClearML API client of the managers. The requests are sent on the session of the
+# process, which adds the token to the header, and only logs in again when the token is
+# near its expiry, or once if the server rejects it.
+class ApiClient:
+    def __init__(self, config_loader):
+        self.session = get_session(config_loader)
+
+    def send_request(self, endpoint, payload=None):
+        """
+        Send a request to an endpoint, e.g. "tasks.get_all", and return the data of the
+        response. Raise if the request failed.
+        """
+        service, action = endpoint.split(".")
+        resp = self.session.send_request(service, action, json=payload or {})
+        if resp.status_code != 200:
+            raise Exception(
+                f"Request {endpoint} failed with status code {resp.status_code}"
+            )
+        return resp.json().get("data")
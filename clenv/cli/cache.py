@@ -0,0 +1,47 @@
+# Helpers for the files clenv caches between invocations, e.g. parsed config values.
+# The cache lives in $XDG_CACHE_HOME/clenv, which is ~/.cache/clenv by default.
+import json
+import os
+import tempfile
+
+
+def get_cache_dir():
+    # An empty or relative XDG_CACHE_HOME is invalid and ignored, as the XDG spec requires,
+    # otherwise the cache, credentials included, would land in the current directory
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home or not os.path.isabs(cache_home):
+        cache_home = os.path.expanduser("~/.cache")
+    cache_dir = os.path.join(cache_home, "clenv")
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    return cache_dir
+
+
+def get_cache_file_path(file_name):
+    return os.path.join(get_cache_dir(), file_name)
+
+
+# Load the json content of a cache file. Return None if the file doesn't exist or is
+# malformed, a broken cache file is the same as a cold cache.
+def read_cache_file(file_path):
+    try:
+        with open(file_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Write the json content to a cache file. The content is written to a temp file in
+# the same directory first and then renamed over the cache file, so that concurrent
+# clenv invocations never read a partially written cache file. The file is only
+# readable by the user.
+def write_cache_file(file_path, content):
+    fd, tmp_file_path = tempfile.mkstemp(
+        prefix=".clenv-cache-", dir=os.path.dirname(file_path)
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp_file_path, file_path)
+    except:
+        os.remove(tmp_file_path)
+        raise
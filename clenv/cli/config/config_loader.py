@@ -1,27 +1,109 @@
-from pyhocon import ConfigFactory, ConfigTree
+from clenv.cli.cache import get_cache_file_path, read_cache_file, write_cache_file
+import hashlib
 import os
 
+# Sentinel for a get_config_value() call without default value
+MISSING = object()
+
 
 class ConfigLoader:
-    def __init__(self, config_file_path) -> None:
+    def __init__(self, config_file_path=None) -> None:
         """
         Load the ~/clearml.conf file as Hocon config object
         """
+        # Same as ClearML, the CLEARML_CONFIG_FILE environment variable overrides the
+        # default config file path
         if config_file_path is None:
-            config_file_path = "~/clearml.conf"
+            config_file_path = os.environ.get("CLEARML_CONFIG_FILE", "~/clearml.conf")
 
         self.__config_file_path = os.path.expanduser(config_file_path)
+        self.__config = None
+        self.__config_values = None
 
     def load(self):
-        self.__config = ConfigFactory.parse_file(self.__config_file_path)
+        """
+        Load the flattened config values, from the cache if the config file hasn't changed
+        since it was cached, otherwise by parsing the config file
+        """
+        cache_file_path = self.__get_cache_file_path()
+        signature = self.__stat_signature()
+        cache = read_cache_file(cache_file_path)
+        if cache is not None and cache.get("signature") == signature:
+            self.__config_values = cache["values"]
+            return
 
-    def get_config_value(self, key: str):
+        self.__parse()
+        self.__config_values = {}
+        self.__flatten(self.__config.as_plain_ordered_dict(), "", self.__config_values)
+        write_cache_file(
+            cache_file_path, {"signature": signature, "values": self.__config_values}
+        )
+
+    def get_config_value(self, key: str, default=MISSING):
         """
-        Get the value of the key from the config object
+        Get the value of the key from the config object, or default if the key is not
+        in the config and a default is given
         """
         # The key could be a nested key, e.g. api.web_server
-        # recursively get the value of the key
+        # Leaf values are served from the flattened config values, the other keys, e.g. api,
+        # need the full Hocon config object
+        if self.__config_values is None:
+            self.load()
+        if key in self.__config_values:
+            return self.__config_values[key]
+        key_prefix = f"{key}."
+        is_tree = any(k.startswith(key_prefix) for k in self.__config_values)
+        if not is_tree and default is not MISSING:
+            return default
 
+        if self.__config is None:
+            self.__parse()
         # Get the value of the key from the config object
-        config_value = self.__config.get(key)
-        return config_value
+        if default is MISSING:
+            return self.__config.get(key)
+        return self.__config.get(key, default)
+
+    def get_config_values(self, *keys, default=MISSING):
+        """
+        Get the values of several keys at once, as a dict of key to value
+        """
+        return {key: self.get_config_value(key, default) for key in keys}
+
+    def __parse(self):
+        # pyhocon is slow to import and to parse, so it's only used on a cold cache
+        from pyhocon import ConfigFactory
+
+        self.__config = ConfigFactory.parse_file(self.__config_file_path)
+
+    # Flatten the leaf values of the config into a dict of dotted key to value, e.g.
+    # {"api.web_server": "http://localhost:8080"}
+    def __flatten(self, config_dict, prefix, config_values):
+        for key, value in config_dict.items():
+            if isinstance(value, dict):
+                self.__flatten(value, f"{prefix}{key}.", config_values)
+            else:
+                config_values[f"{prefix}{key}"] = self.__to_plain_value(value)
+
+    # pyhocon represents null as a NoneValue object, which can't be cached as json
+    def __to_plain_value(self, value):
+        from pyhocon.config_tree import NoneValue
+
+        if isinstance(value, NoneValue):
+            return None
+        if isinstance(value, list):
+            return [self.__to_plain_value(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.__to_plain_value(item) for key, item in value.items()}
+        return value
+
+    # The cache file is specific to the config file path, so that profiles selected
+    # through CLEARML_CONFIG_FILE don't evict each other
+    def __get_cache_file_path(self):
+        path_hash = hashlib.sha1(self.__config_file_path.encode("utf-8")).hexdigest()
+        return get_cache_file_path(f"config-{path_hash[:16]}.json")
+
+    # The cache is invalidated by the modification time, size and inode of the config
+    # file. The inode changes when a profile is checked out by renaming config files.
+    def __stat_signature(self):
+        stat = os.stat(self.__config_file_path)
+        return [stat.st_mtime_ns, stat.st_size, stat.st_ino]
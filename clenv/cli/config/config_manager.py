@@ -7,20 +7,47 @@ import json
 import os
 import re
 import shutil
+import stat
+import tempfile
 from pyhocon import ConfigFactory, HOCONConverter
 
+# The directory holding the config files of the non-active profiles
+DEFAULT_PROFILE_DIR = "~/.clenv/profiles"
+# The active profile stays at the location ClearML reads its config file from
+ACTIVE_CONFIG_FILE_PATH = "~/clearml.conf"
+PROFILE_FILE_PATTERN = re.compile(r"^clearml-(.+)\.conf$")
+
 
 class ConfigManager:
-    def __init__(self, index_file_path, save_index=True):
+    def __init__(
+        self, index_file_path, save_index=True, rescan=False, profile_dir=None
+    ):
         """
         Initialize a new index for the given index file path.
         :param index_file_path: The file path of the index file.
-        :param save_index: Whether to save the index after refreshing it. Defaults to True.
+        :param save_index: Whether to save the index after refreshing it, if the refresh
+            changed it. Defaults to True.
+        :param rescan: Whether to re-validate every config file, even the ones whose
+            stat info hasn't changed since the last scan. Defaults to False.
+        :param profile_dir: The directory of the non-active profile config files.
+            Defaults to ~/.clenv/profiles.
         """
         self.__index_file_path = index_file_path
-        self.__EMPTY_INDEX_JSON = {"profiles": {"active": [], "non_active": []}}
+        if profile_dir is None:
+            profile_dir = DEFAULT_PROFILE_DIR
+        self.__profile_dir = os.path.expanduser(profile_dir)
+        if not os.path.isdir(self.__profile_dir):
+            self.__migrate_home_profiles()
+        self.__EMPTY_INDEX_JSON = {
+            "profiles": {"active": [], "non_active": []},
+            "files": {},
+        }
         index_json = self.__load_index_file(index_file_path)
-        self.__new_index_json = self.__refresh_index(index_json)
+        self.__new_index_json = self.__refresh_index(index_json, rescan)
+        # The index only needs to be written back if it differs from the file content.
+        # Methods that mutate the index mark it dirty instead of saving it, the caller
+        # is responsible for calling save_index() once it's done.
+        self.__dirty = self.__new_index_json != index_json
         if save_index:
             self.save_index()
 
@@ -76,9 +103,12 @@ class ConfigManager:
             # If the profile is found, rename it
             if profile["profile_name"] == old_profile_name:
                 profile["profile_name"] = new_profile_name
-                # If the profile is active, do not rename the config file path
+                # If the profile is active, do not rename the config file path, unless
+                # ~/clearml.conf is a symlink, in which case the profile's own file is
+                # renamed and the symlink is pointed to the new file path
                 # If the profile is non-active, rename the config file path
-                if profile in self.__new_index_json["profiles"]["non_active"]:
+                is_active = profile in self.__new_index_json["profiles"]["active"]
+                if not is_active or self.uses_symlink():
                     # Rename the config file path
                     new_file_path = os.path.expanduser(
                         profile["file_path"].replace(
@@ -88,8 +118,10 @@ class ConfigManager:
                     )
                     os.rename(os.path.expanduser(profile["file_path"]), new_file_path)
                     profile["file_path"] = new_file_path
+                    if is_active:
+                        self.__link_active_config(new_file_path)
                 # Save the new index
-                self.save_index()
+                self.__dirty = True
                 return
         # If the profile is not found, raise an error
         raise Exception(f"Profile {old_profile_name} does not exist")
@@ -103,15 +135,25 @@ class ConfigManager:
             == self.__new_index_json["profiles"]["active"][0]["profile_name"]
         )
 
+    # Whether ~/clearml.conf is a symlink to the config file of the active profile in the
+    # profile directory, rather than the active config file itself
+    def uses_symlink(self):
+        return os.path.islink(os.path.expanduser(ACTIVE_CONFIG_FILE_PATH))
+
     # Switch the active profile to the profile with the given profile_name, the profile_name must
     # be in the non_active list, if not, throw an exception
+    # If ~/clearml.conf is a symlink, or symlink is True, switching is done by atomically
+    # replacing the ~/clearml.conf symlink, otherwise the config files are renamed
     # Solution
-    def set_active_profile(self, profile_name):
+    def set_active_profile(self, profile_name, symlink=False):
         # Check if the profile_name is in the non_active list
         non_active_profile_list = self.__new_index_json["profiles"]["non_active"]
         active_profile_list = self.__new_index_json["profiles"]["active"]
         if profile_name == active_profile_list[0]["profile_name"]:
             raise Exception(f"Profile {profile_name} is already the active profile")
+        if symlink or self.uses_symlink():
+            self.__set_active_profile_by_symlink(profile_name)
+            return
         for profile in non_active_profile_list:
             try:
                 if profile["profile_name"] == profile_name:
@@ -121,8 +163,8 @@ class ConfigManager:
                     # Remove the active profile from the active list
                     active_profile = self.__new_index_json["profiles"]["active"][0]
                     old_active_fp = active_profile["file_path"]
-                    active_profile["file_path"] = active_profile["file_path"].replace(
-                        "clearml.conf", f'clearml-{active_profile["profile_name"]}.conf'
+                    active_profile["file_path"] = self.__profile_file_path(
+                        active_profile["profile_name"]
                     )
                     self.__new_index_json["profiles"]["non_active"].append(
                         active_profile
@@ -139,20 +181,58 @@ class ConfigManager:
                     # Remove the matching non-active profile from the non-active list
                     self.__new_index_json["profiles"]["non_active"].remove(profile)
                     old_inactive_fp = profile["file_path"]
-                    profile["file_path"] = profile["file_path"].replace(
-                        f"clearml-{profile_name}.conf", "clearml.conf"
-                    )
+                    profile["file_path"] = os.path.expanduser(ACTIVE_CONFIG_FILE_PATH)
                     os.rename(
                         os.path.expanduser(old_inactive_fp),
                         os.path.expanduser(profile["file_path"]),
                     )
                     self.__new_index_json["profiles"]["active"].append(profile)
-                    self.save_index()
+                    self.__dirty = True
                     return
             except:
                 raise
         raise Exception(f"Profile {profile_name} does not exist")
 
+    # Switch the active profile by pointing the ~/clearml.conf symlink to the config file of
+    # the profile. It's a single atomic rename no matter how many profiles there are, so
+    # ~/clearml.conf is always a valid config, and processes that have the previous config
+    # file open keep reading it.
+    def __set_active_profile_by_symlink(self, profile_name):
+        if not self.uses_symlink():
+            self.__convert_active_config_to_symlink()
+        profile = self.get_profile(profile_name)
+        self.__link_active_config(os.path.expanduser(profile["file_path"]))
+        active_profile = self.__new_index_json["profiles"]["active"][0]
+        self.__new_index_json["profiles"]["active"] = [profile]
+        self.__new_index_json["profiles"]["non_active"].remove(profile)
+        self.__new_index_json["profiles"]["non_active"].append(active_profile)
+        self.__dirty = True
+
+    # Move the active config file into the profile directory and replace ~/clearml.conf
+    # with a symlink to it. The file is copied before ~/clearml.conf is replaced, so an
+    # interruption never leaves the active profile without a config file.
+    def __convert_active_config_to_symlink(self):
+        active_profile = self.__new_index_json["profiles"]["active"][0]
+        if active_profile["profile_name"] == "untitled":
+            raise Exception(
+                "The active profile must be named before switching by symlink"
+            )
+        profile_file_path = self.__profile_file_path(active_profile["profile_name"])
+        shutil.copy2(os.path.expanduser(active_profile["file_path"]), profile_file_path)
+        self.__link_active_config(profile_file_path)
+        active_profile["file_path"] = profile_file_path
+
+    # Atomically point the ~/clearml.conf symlink to target_file_path
+    def __link_active_config(self, target_file_path):
+        active_file_path = os.path.expanduser(ACTIVE_CONFIG_FILE_PATH)
+        tmp_link_path = f"{active_file_path}.{os.getpid()}.tmp"
+        os.symlink(target_file_path, tmp_link_path)
+        try:
+            os.replace(tmp_link_path, active_file_path)
+        except:
+            os.remove(tmp_link_path)
+            raise
+
     # Create a new profile based on the given profile_name, the profile_name must not be in the
     # active list or the non_active list, if it is, throw an exception
     # Solution
@@ -161,7 +241,7 @@ class ConfigManager:
             raise Exception(f"Profile {profile_name} already exists")
         new_profile = {
             "profile_name": profile_name,
-            "file_path": os.path.expanduser(f"~/clearml-{profile_name}.conf"),
+            "file_path": self.__profile_file_path(profile_name),
         }
         self.__new_index_json["profiles"]["non_active"].append(new_profile)
         # Copy the config file specified by base_profile_name and rename it to the file_path
@@ -174,7 +254,7 @@ class ConfigManager:
             os.path.expanduser(new_profile["file_path"]),
         )
 
-        self.save_index()
+        self.__dirty = True
 
     # Delete the profile with the given profile_name, the profile_name must be in the
     # active list or the non_active list, if it is not, throw an exception
@@ -189,7 +269,7 @@ class ConfigManager:
             if profile["profile_name"] == profile_name:
                 self.__new_index_json["profiles"]["non_active"].remove(profile)
                 os.remove(os.path.expanduser(profile["file_path"]))
-                self.save_index()
+                self.__dirty = True
                 return
 
     def has_profile(self, profile_name):
@@ -201,9 +281,29 @@ class ConfigManager:
                 return True
         return False
 
+    def is_dirty(self):
+        return self.__dirty
+
+    # Write the index file if it has changed. The content is written to a temp file in
+    # the same directory first and then renamed over the index file, so that concurrent
+    # clenv invocations never see a truncated index file.
     def save_index(self):
-        with open(os.path.expanduser(self.__index_file_path), "w") as f:
-            f.write(json.dumps(self.__new_index_json, indent=4))
+        if not self.__dirty:
+            return
+        index_file_path = os.path.expanduser(self.__index_file_path)
+        fd, tmp_file_path = tempfile.mkstemp(
+            prefix=".clenv-index-", dir=os.path.dirname(index_file_path)
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(json.dumps(self.__new_index_json, indent=4))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file_path, index_file_path)
+        except:
+            os.remove(tmp_file_path)
+            raise
+        self.__dirty = False
 
     # Reinitialize the api part of the config file of a specific profile, make sure the api_config
     # is a a valid hocon format string using pyhocon. Then replace the 'api' section of the config file
@@ -223,13 +323,15 @@ class ConfigManager:
         except:
             raise Exception("Invalid api_config_str")
 
-    def __refresh_index(self, index_json):
-        # Scan the home directory
-        new_index_json = self.__scan_home_dir()
+    def __refresh_index(self, index_json, rescan):
+        # Scan the config files, only the ones whose stat info differs from the one
+        # recorded in the index are parsed again
+        new_index_json = self.__scan_profile_dir(index_json.get("files", {}), rescan)
 
         # If the default profile in index_json is not empty, update the new_index_json with the default profile
-        # in index_json
-        if len(index_json["profiles"]["active"]) > 0:
+        # in index_json. When ~/clearml.conf is a symlink, the active profile name is known
+        # from the file it points to instead.
+        if len(index_json["profiles"]["active"]) > 0 and not self.uses_symlink():
             new_index_json["profiles"]["active"] = index_json["profiles"]["active"]
 
         return new_index_json
@@ -248,57 +350,109 @@ class ConfigManager:
             except:
                 return self.__EMPTY_INDEX_JSON
 
-    def __scan_home_dir(self):
-        # get the home directory
-        home_dir = os.path.expanduser("~")
-        # get the list of files in the home directory
-        files = os.listdir(home_dir)
-        # create lists to store the active and non-active profiles
+    # Scan for config files: the active profile is ~/clearml.conf and the non-active
+    # ones are the clearml-<profile_name>.conf files in the profile directory. If
+    # ~/clearml.conf is a symlink, the profile file it points to is the active one. file_stats
+    # maps the file paths of the config files validated by the last scan to their stat
+    # signature. A file is parsed only if it is new, its signature changed, or rescan is
+    # True.
+    def __scan_profile_dir(self, file_stats, rescan):
         active_profile_list = []
         non_active_profile_list = []
-        # for each file in the home directory
-        for file in files:
-            # if the file is a config file
-            if (
-                file.endswith(".conf")
-                and not os.path.isdir(file)
-                and not os.path.islink(file)
-                and "clearml" in file
-            ):
-                try:
-                    # parse the file
-                    ConfigFactory.parse_file(f"{home_dir}/{file}")
-                    # if the file is the active profile
-                    if file == "clearml.conf":
-                        # add the file to the list of active profiles
-                        active_profile_list.append(
-                            {
-                                "profile_name": self.__extract_profile_name(file),
-                                "file_path": f"{home_dir}/{file}",
-                            }
-                        )
-                    # if the file is not the active profile
-                    else:
-                        # add the file to the list of non-active profiles
-                        non_active_profile_list.append(
-                            {
-                                "profile_name": self.__extract_profile_name(file),
-                                "file_path": f"{home_dir}/{file}",
-                            }
-                        )
-                except:
-                    # throw an error
-                    raise Exception(
-                        f"Not a valid config file: {file}, check file content"
-                    )
+        new_file_stats = {}
+
+        active_file_path = os.path.expanduser(ACTIVE_CONFIG_FILE_PATH)
+        try:
+            active_stat = os.lstat(active_file_path)
+        except FileNotFoundError:
+            active_stat = None
+        # The (device, inode) of the active profile's file when ~/clearml.conf is a symlink
+        active_link_target = None
+        if active_stat is not None and stat.S_ISREG(active_stat.st_mode):
+            new_file_stats[active_file_path] = self.__validate_config_file(
+                active_file_path, active_stat, file_stats, rescan
+            )
+            active_profile_list.append(
+                {
+                    "profile_name": self.__extract_profile_name("clearml.conf"),
+                    "file_path": active_file_path,
+                }
+            )
+        elif active_stat is not None and stat.S_ISLNK(active_stat.st_mode):
+            try:
+                target_stat = os.stat(active_file_path)
+                active_link_target = (target_stat.st_dev, target_stat.st_ino)
+            except FileNotFoundError:
+                # A dangling symlink, there is no active profile
+                pass
+
+        # A single pass over the profile directory. The file name is matched before
+        # anything else, and DirEntry caches the file type, so only the config files
+        # cost an extra stat call
+        with os.scandir(self.__profile_dir) as entries:
+            for entry in entries:
+                if PROFILE_FILE_PATTERN.match(entry.name) is None:
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                entry_stat = entry.stat(follow_symlinks=False)
+                new_file_stats[entry.path] = self.__validate_config_file(
+                    entry.path, entry_stat, file_stats, rescan
+                )
+                profile = {
+                    "profile_name": self.__extract_profile_name(entry.name),
+                    "file_path": entry.path,
+                }
+                if active_link_target == (entry_stat.st_dev, entry_stat.st_ino):
+                    active_profile_list.append(profile)
+                else:
+                    non_active_profile_list.append(profile)
 
         return {
             "profiles": {
                 "active": active_profile_list,
                 "non_active": non_active_profile_list,
-            }
+            },
+            "files": new_file_stats,
         }
 
+    # Parse the config file unless its stat signature is the same as the one recorded
+    # when it was last validated. Return the stat signature of the file.
+    def __validate_config_file(self, file_path, file_stat, file_stats, rescan):
+        signature = self.__stat_signature(file_stat)
+        if rescan or file_stats.get(file_path) != signature:
+            try:
+                ConfigFactory.parse_file(file_path)
+            except:
+                raise Exception(
+                    f"Not a valid config file: {file_path}, check file content"
+                )
+        return signature
+
+    # Move the clearml-<profile_name>.conf files from the home directory, where they used
+    # to be kept, to the profile directory. It's done once, when the profile directory
+    # is created. The clearml-server-<username>.conf files generated by
+    # `clenv user genpass` are not profiles and stay in the home directory.
+    def __migrate_home_profiles(self):
+        os.makedirs(self.__profile_dir, exist_ok=True)
+        with os.scandir(os.path.expanduser("~")) as entries:
+            for entry in entries:
+                if PROFILE_FILE_PATTERN.match(entry.name) is None:
+                    continue
+                if entry.name.startswith("clearml-server-"):
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                shutil.move(entry.path, os.path.join(self.__profile_dir, entry.name))
+
+    def __profile_file_path(self, profile_name):
+        return os.path.join(self.__profile_dir, f"clearml-{profile_name}.conf")
+
+    # The stat signature of a file is its modification time, size and inode. It's
+    # stored as a list so that it compares equal to the one loaded from the index file
+    def __stat_signature(self, file_stat):
+        return [file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino]
+
     # Extract profile name from the file name, if the file name is clearml.conf, the profile name should be default
     # If the file name is clearml-<profile_name>.conf, the profile name should be <profile_name>
     # Use regex to extract the profile name
@@ -306,4 +460,4 @@ class ConfigManager:
         if file_name == "clearml.conf":
             return "untitled"
         else:
-            return re.match(r"clearml-(.+)\.conf", file_name).group(1)
+            return PROFILE_FILE_PATTERN.match(file_name).group(1)
@@ -1,5 +1,6 @@
-from .config_manager import ConfigManager
+from .config_manager import ConfigManager, DEFAULT_PROFILE_DIR
 import click
+import shlex
 
 
 INDEX_FILE_PATH = "~/.clenv-config-index.json"
@@ -8,8 +9,35 @@ EMPTY_INDEX_JSON = {"profiles": {}}
 
 # Create a group
 @click.group(help="Manage config files")
-def config():
-    pass
+@click.option(
+    "--rescan",
+    is_flag=True,
+    help="Validate all config files again, even the unchanged ones",
+)
+@click.option(
+    "--profile-dir",
+    envvar="CLENV_PROFILE_DIR",
+    default=DEFAULT_PROFILE_DIR,
+    show_default=True,
+    help="Directory of the non-active profile config files",
+)
+@click.pass_context
+def config(ctx, rescan, profile_dir):
+    ctx.obj = {"rescan": rescan, "profile_dir": profile_dir}
+
+
+# Create a ConfigManager for the index file, honoring the options of the config group.
+# The index is saved once when the command finishes, and only if it has changed.
+def new_config_manager():
+    ctx = click.get_current_context()
+    config_manager = ConfigManager(
+        INDEX_FILE_PATH,
+        save_index=False,
+        rescan=ctx.obj["rescan"],
+        profile_dir=ctx.obj["profile_dir"],
+    )
+    ctx.call_on_close(config_manager.save_index)
+    return config_manager
 
 
 @click.option(
@@ -17,7 +45,7 @@ def config():
 )
 @config.command(help="List all config profiles")
 def list(showpath):
-    config_manager = ConfigManager(INDEX_FILE_PATH)
+    config_manager = new_config_manager()
 
     # If the profile has not been initialized, prompt the user to input a profile name
     # The default profile name is 'default'
@@ -46,8 +74,14 @@ def list(showpath):
 # Solution
 @config.command(name="checkout", help="Checkout another profile")
 @click.argument("profile_name")
-def checkout(profile_name):
-    config_manager = ConfigManager(INDEX_FILE_PATH)
+@click.option(
+    "--symlink",
+    is_flag=True,
+    help="Make ~/clearml.conf a symlink to the profile instead of renaming config files. "
+    + "Once ~/clearml.conf is a symlink, all checkouts switch the symlink",
+)
+def checkout(profile_name, symlink):
+    config_manager = new_config_manager()
     if not config_manager.has_profile(profile_name=profile_name):
         click.echo(f"Profile {profile_name} does not exist")
         return
@@ -56,17 +90,31 @@ def checkout(profile_name):
         click.echo(f"Profile {profile_name} is already active")
         return
     else:
-        config_manager.set_active_profile(profile_name)
+        config_manager.set_active_profile(profile_name, symlink=symlink)
         click.echo(f'Profile "{profile_name}" is now active')
 
 
+# Print a shell command exporting CLEARML_CONFIG_FILE with the config file of the profile,
+# to use a profile in the current shell only, without touching any file:
+#   eval "$(clenv config env <profile_name>)"
+@config.command(help="Print the shell export to use a profile in the current shell")
+@click.argument("profile_name")
+def env(profile_name):
+    config_manager = new_config_manager()
+    if not config_manager.has_profile(profile_name=profile_name):
+        # Exit with an error status, which `eval "$(...)"` would otherwise hide
+        raise click.ClickException(f"Profile {profile_name} does not exist")
+    profile = config_manager.get_profile(profile_name)
+    click.echo(f"export CLEARML_CONFIG_FILE={shlex.quote(profile['file_path'])}")
+
+
 # Create a new profile, the profile name is specified by the user
 # If the profile name is already in the index file, print an error message and exit
 @click.argument("profile_name", required=True)
 @click.option("--base", "-b", help="Base profile name")
 @config.command(help="Create a new profile")
 def create(profile_name, base):
-    config_manager = ConfigManager(INDEX_FILE_PATH)
+    config_manager = new_config_manager()
     if config_manager.has_profile(profile_name=profile_name):
         click.echo(f"Profile {profile_name} already exists")
         return
@@ -80,7 +128,7 @@ def create(profile_name, base):
 @click.argument("profile_name", required=True)
 @config.command(name="del", help="Delete a profile")
 def delete(profile_name):
-    config_manager = ConfigManager(INDEX_FILE_PATH)
+    config_manager = new_config_manager()
     # Check if the profile exists
     if not config_manager.has_profile(profile_name=profile_name):
         click.echo(f"Profile {profile_name} does not exist")
@@ -102,7 +150,7 @@ def delete(profile_name):
 @click.argument("new_profile_name", required=True)
 def rename(old_profile_name, new_profile_name):
     # Define a ConfigManager object for the index file
-    config_manager = ConfigManager(INDEX_FILE_PATH)
+    config_manager = new_config_manager()
     # If the old profile doesn't exist, print an error message
     if not config_manager.has_profile(profile_name=old_profile_name):
         click.echo(f"Profile {old_profile_name} does not exist")
@@ -127,7 +175,7 @@ def reinit(base_profile):
     config = read_multiline()
 
     # Reinitialize the api section of the config file.
-    config_manager = ConfigManager(INDEX_FILE_PATH)
+    config_manager = new_config_manager()
     config_manager.reinitialize_api_config(base_profile, config)
 
 
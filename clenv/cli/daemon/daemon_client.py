@@ -0,0 +1,167 @@
+from clenv.cli.api_client import DAEMON_ENV_VAR
+from clenv.cli.cache import get_cache_dir
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+# The opt-in daemon keeps the ClearML SDK imported, the API session logged in and the queue
+# snapshot warm, for one user and one profile. The clenv commands talk to it over a Unix
+# domain socket instead of importing the SDK and logging in themselves. The session of
+# the process is got by clenv.cli.api_client.get_session.
+DAEMON_START_TIMEOUT_SEC = 10
+
+
+def get_config_file_path():
+    # Same as the ConfigLoader and ClearML
+    return os.path.realpath(
+        os.path.expanduser(os.environ.get("CLEARML_CONFIG_FILE", "~/clearml.conf"))
+    )
+
+
+# The socket of the daemon of a profile. With symlinked profiles, every profile has its
+# own daemon. The socket lives in a directory only readable by the user.
+def get_socket_path(config_file_path=None):
+    socket_dir = os.environ.get("XDG_RUNTIME_DIR")
+    # A relative XDG_RUNTIME_DIR is invalid and ignored, as the XDG spec requires
+    if socket_dir and os.path.isabs(socket_dir):
+        socket_dir = os.path.join(socket_dir, "clenv")
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    else:
+        socket_dir = get_cache_dir()
+    key = hashlib.sha1((config_file_path or get_config_file_path()).encode("utf-8"))
+    return os.path.join(socket_dir, f"daemon-{key.hexdigest()[:16]}.sock")
+
+
+class DaemonNotRunning(Exception):
+    pass
+
+
+class DaemonClient:
+    def __init__(self, socket_path=None):
+        self.__socket_path = socket_path or get_socket_path()
+
+    # Send a request to the daemon and return its result. Every request is a connection,
+    # with a JSON line each way, so that threads can send requests concurrently.
+    def __send(self, op, params):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                conn.connect(self.__socket_path)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                raise DaemonNotRunning(str(e))
+            try:
+                conn.sendall(json.dumps({"op": op, **params}).encode("utf-8") + b"\n")
+                with conn.makefile("rb") as f:
+                    line = f.readline()
+            except (BrokenPipeError, ConnectionResetError) as e:
+                # The daemon is exiting
+                raise DaemonNotRunning(str(e))
+        finally:
+            conn.close()
+        if not line:
+            raise DaemonNotRunning("The daemon closed the connection")
+        resp = json.loads(line)
+        if resp.get("restart"):
+            # The daemon is exiting because the profile changed
+            raise DaemonNotRunning("The profile changed")
+        if "error" in resp:
+            raise Exception(resp["error"])
+        return resp["result"]
+
+    def call(self, op, **params):
+        """
+        Send a request to the daemon, starting it if it's not running
+        """
+        try:
+            return self.__send(op, params)
+        except DaemonNotRunning:
+            self.start()
+            return self.__send(op, params)
+
+    def is_running(self):
+        try:
+            self.__send("info", {})
+            return True
+        except DaemonNotRunning:
+            return False
+
+    def info(self):
+        """
+        Get the pid, the server host and the config file of the daemon, or None if it's
+        not running
+        """
+        try:
+            return self.__send("info", {})
+        except DaemonNotRunning:
+            return None
+
+    def start(self):
+        """
+        Start the daemon in the background, and wait until it accepts requests
+        """
+        log_file_path = os.path.splitext(self.__socket_path)[0] + ".log"
+        with open(log_file_path, "ab") as log_file:
+            subprocess.Popen(
+                [sys.executable, "-m", "clenv.cli", "daemon", "run"],
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=log_file,
+                # The daemon outlives the command, and never uses a daemon itself
+                start_new_session=True,
+                env=dict(os.environ, **{DAEMON_ENV_VAR: "0"}),
+            )
+        deadline = time.monotonic() + DAEMON_START_TIMEOUT_SEC
+        while time.monotonic() < deadline:
+            if self.is_running():
+                return
+            time.sleep(0.05)
+        raise Exception(f"The daemon did not start, see {log_file_path}")
+
+
+# A response of the daemon to an API request, with the interface of the requests responses
+# used by the managers
+class DaemonResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.__body = body
+
+    def json(self):
+        return self.__body
+
+
+# An API session whose requests are sent by the daemon, on its logged in session
+class DaemonSession:
+    def __init__(self, client):
+        self.__client = client
+        self.host = client.call("info")["host"]
+
+    def send_request(self, service, action, json=None):
+        result = self.__client.call(
+            "request", service=service, action=action, payload=json or {}
+        )
+        return DaemonResponse(result["status_code"], result["body"])
+
+    def get_queues(self, max_age_sec):
+        """
+        Get the queue snapshot held by the daemon, fetched at most max_age_sec ago
+        """
+        return self.__client.call("queues", max_age_sec=max_age_sec)
+
+    def clone_task(self, base_task_id, run_config):
+        """
+        Clone a task with the ClearML SDK already imported by the daemon. Return the id and
+        the output log page of the new task.
+        """
+        return self.__client.call(
+            "clone_task", base_task_id=base_task_id, run_config=run_config
+        )
+
+    def update_cloned_task(self, task_id, git_info):
+        """
+        Update a task cloned by clone_task to run on the branch and the commit of git_info
+        """
+        self.__client.call("update_cloned_task", task_id=task_id, git_info=git_info)
@@ -0,0 +1,161 @@
+from clenv.cli.daemon.daemon_client import get_config_file_path, get_socket_path
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+
+# The daemon of a profile. It serves the requests of the DaemonClient on a Unix domain
+# socket, one JSON line each way per connection, and exits once idle for idle_timeout_sec
+# or when the config file of the profile changes.
+class DaemonServer:
+    def __init__(self, idle_timeout_sec):
+        self.__idle_timeout_sec = idle_timeout_sec
+        self.__config_file_path = get_config_file_path()
+        self.__socket_path = get_socket_path(self.__config_file_path)
+        self.__config_signature = self.__get_config_signature()
+        self.__last_request_at = time.monotonic()
+        self.__queues_lock = threading.Lock()
+        self.__queues_fetched_at = None
+        self.__server = None
+        self.__socket_inode = None
+
+    def __get_config_signature(self):
+        try:
+            file_stat = os.stat(self.__config_file_path)
+        except FileNotFoundError:
+            return None
+        return [file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino]
+
+    def serve(self):
+        # The point of the daemon: the SDK is imported and the session logged in once
+        from clenv.cli.config.config_loader import ConfigLoader
+        from clenv.cli.queue.cached_token_session import get_configured_session
+        from clenv.cli.queue.queue_manager import QueueManager
+        from clenv.cli.task import task_subcommand
+
+        config_loader = ConfigLoader()
+        config_loader.load()
+        self.__session = get_configured_session(config_loader)
+        self.__queue_manager = QueueManager(snapshot_ttl_sec=0)
+        self.__task_subcommand = task_subcommand
+
+        self.__remove_stale_socket()
+        handle = self.__handle
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                handle(self.rfile, self.wfile)
+
+        # The socket is only accessible by the user
+        old_umask = os.umask(0o077)
+        try:
+            self.__server = socketserver.ThreadingUnixStreamServer(
+                self.__socket_path, Handler
+            )
+        finally:
+            os.umask(old_umask)
+        self.__socket_inode = os.stat(self.__socket_path).st_ino
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__watch_idle, daemon=True).start()
+        try:
+            self.__server.serve_forever()
+        finally:
+            self.__server.server_close()
+            self.__remove_socket()
+
+    # A socket file left by a daemon that crashed makes the bind fail
+    def __remove_stale_socket(self):
+        if not os.path.exists(self.__socket_path):
+            return
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.__socket_path)
+        except ConnectionRefusedError:
+            os.remove(self.__socket_path)
+        else:
+            raise Exception(f"A daemon is already listening on {self.__socket_path}")
+        finally:
+            conn.close()
+
+    # Remove the socket file, unless it's already the one of a new daemon
+    def __remove_socket(self):
+        try:
+            if os.stat(self.__socket_path).st_ino == self.__socket_inode:
+                os.remove(self.__socket_path)
+        except FileNotFoundError:
+            pass
+
+    def __watch_idle(self):
+        while time.monotonic() - self.__last_request_at < self.__idle_timeout_sec:
+            time.sleep(1)
+        self.__server.shutdown()
+
+    def __stop(self):
+        # The new clients can't connect anymore, they start a new daemon
+        self.__remove_socket()
+        # shutdown() waits for serve_forever() to return, so it's called from another
+        # thread than the handler's one
+        threading.Thread(target=self.__server.shutdown, daemon=True).start()
+
+    def __handle(self, rfile, wfile):
+        self.__last_request_at = time.monotonic()
+        try:
+            request = json.loads(rfile.readline())
+            if self.__get_config_signature() != self.__config_signature:
+                # The profile changed, e.g. `clenv config checkout`. The ClearML SDK loads
+                # its config once per process, so the daemon exits, and the client starts
+                # a new one.
+                resp = {"restart": True}
+                self.__stop()
+            elif request["op"] == "shutdown":
+                resp = {"result": None}
+                self.__stop()
+            else:
+                resp = {"result": self.__dispatch(request)}
+        except Exception as e:
+            resp = {"error": str(e)}
+        wfile.write(json.dumps(resp).encode("utf-8") + b"\n")
+
+    def __dispatch(self, request):
+        op = request["op"]
+        if op == "info":
+            return {
+                "pid": os.getpid(),
+                "host": self.__session.host,
+                "config_file": self.__config_file_path,
+            }
+        if op == "request":
+            resp = self.__session.send_request(
+                request["service"], request["action"], json=request["payload"]
+            )
+            try:
+                body = resp.json()
+            except ValueError:
+                body = None
+            return {"status_code": resp.status_code, "body": body}
+        if op == "queues":
+            with self.__queues_lock:
+                if (
+                    self.__queues_fetched_at is None
+                    or time.monotonic() - self.__queues_fetched_at
+                    > request["max_age_sec"]
+                ):
+                    self.__queue_manager.refresh()
+                    self.__queues_fetched_at = time.monotonic()
+                return self.__queue_manager.get_all_queues()
+        if op == "clone_task":
+            task = self.__task_subcommand.clone_task(
+                request["base_task_id"], request["run_config"]
+            )
+            return {"id": task.id, "log_url": task.get_output_log_web_page()}
+        if op == "update_cloned_task":
+            from clearml import Task
+
+            self.__task_subcommand.update_cloned_task(
+                Task.get_task(task_id=request["task_id"]), request["git_info"]
+            )
+            return None
+        raise Exception(f"Unknown daemon request {op}")
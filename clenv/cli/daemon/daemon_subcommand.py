@@ -0,0 +1,72 @@
+import click
+
+# Write a subcommand about the clenv daemon
+# The daemon modules are only imported by the commands
+
+
+@click.group(
+    help="Background daemon keeping the ClearML SDK imported and the API session logged "
+    + "in, for the current profile. \n\nThe daemon is opt-in: set the CLENV_DAEMON "
+    + "environment variable to 1, or clenv.daemon.enabled to true in the config file. "
+    + "It's then started by the first command that needs it."
+)
+def daemon():
+    pass
+
+
+@daemon.command(help="Start the daemon of the current profile")
+def start():
+    from clenv.cli.daemon.daemon_client import DaemonClient
+
+    client = DaemonClient()
+    if not client.is_running():
+        client.start()
+    click.echo(f"Daemon running, pid={client.info()['pid']}")
+
+
+@daemon.command(help="Stop the daemon of the current profile")
+def stop():
+    from clenv.cli.daemon.daemon_client import DaemonClient
+
+    client = DaemonClient()
+    if not client.is_running():
+        click.echo("Daemon not running", err=True)
+        return
+    client.call("shutdown")
+    click.echo("Daemon stopped")
+
+
+@daemon.command(help="Show whether the daemon of the current profile is running")
+def status():
+    from clenv.cli.daemon.daemon_client import DaemonClient
+
+    info = DaemonClient().info()
+    if info is None:
+        click.echo("Daemon not running")
+        return
+    click.echo(
+        f"Daemon running, pid={info['pid']}, server {info['host']}, "
+        + f"profile {info['config_file']}"
+    )
+
+
+@daemon.command(hidden=True, help="Run the daemon in the foreground")
+@click.option(
+    "--idle-timeout",
+    type=click.IntRange(min=1),
+    help="Seconds without request after which the daemon exits. Defaults to the "
+    + "clenv.daemon.idle_timeout_sec config value, or 900",
+)
+def run(idle_timeout):
+    from clenv.cli.config.config_loader import ConfigLoader
+    from clenv.cli.api_client import DAEMON_ENV_VAR
+    from clenv.cli.daemon.daemon_server import DaemonServer
+    import os
+
+    # The daemon sends its own requests
+    os.environ[DAEMON_ENV_VAR] = "0"
+    if idle_timeout is None:
+        idle_timeout = ConfigLoader().get_config_value(
+            "clenv.daemon.idle_timeout_sec", 900
+        )
+    DaemonServer(idle_timeout).serve()
@@ -0,0 +1,36 @@
+import importlib
+
+import click
+
+
+# A click group that only imports a subcommand's module when the subcommand is
+# actually invoked. The subcommands are declared as a mapping from command name
+# to an import path in the form of "<module>.<attribute>", so that running
+# `clenv config list` never pays for importing the task (ClearML, GitPython,
+# InquirerPy) machinery.
+class LazyGroup(click.Group):
+    def __init__(self, *args, lazy_subcommands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Mapping of command name -> "<module>.<attribute>" import path
+        self.__lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        base = super().list_commands(ctx)
+        lazy = sorted(self.__lazy_subcommands.keys())
+        return base + lazy
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.__lazy_subcommands:
+            return self.__load(cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def __load(self, cmd_name):
+        import_path = self.__lazy_subcommands[cmd_name]
+        module_name, attr_name = import_path.rsplit(".", 1)
+        module = importlib.import_module(module_name)
+        cmd_object = getattr(module, attr_name)
+        if not isinstance(cmd_object, click.BaseCommand):
+            raise ValueError(
+                f"Lazy loading of {import_path} failed by returning a non-command object"
+            )
+        return cmd_object
@@ -0,0 +1,169 @@
+from clearml.backend_api.session.client.client import StrictSession
+from clearml.backend_interface.base import InterfaceBase
+from clenv.cli.cache import get_cache_file_path, read_cache_file, write_cache_file
+import threading
+import time
+
+TOKEN_CACHE_FILE_NAME = "tokens.json"
+
+# Defaults of the http transport shared by all the API calls of the process
+DEFAULT_TIMEOUT_SEC = (3.0, 30.0)
+# The read timeout of the mutating requests, ClearML's default. They are not retried, so a
+# slow server should not make them time out.
+WRITE_READ_TIMEOUT_SEC = 300.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR_SEC = 0.5
+DEFAULT_BACKOFF_MAX_SEC = 10.0
+DEFAULT_POOL_MAXSIZE = 16
+
+# The API actions that only read, and are safe to send again after a read error
+READ_ONLY_ACTIONS = {"auth.login", "debug.ping"}
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def is_read_only_action(service, action):
+    return action.startswith("get_") or f"{service}.{action}" in READ_ONLY_ACTIONS
+
+
+# A ClearML API session that persists its auth token in the clenv cache directory, per
+# server and access key, so that back-to-back clenv invocations reuse the token instead
+# of logging in again. ClearML sessions log in when they are created; this session uses
+# the cached token for that first login if it's not close to its expiry. Later refreshes,
+# because the token is near expiry or was rejected with 401, always log in and update
+# the cache.
+class CachedTokenSession(StrictSession):
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.__cached_token_used = False
+        self.__request_local = threading.local()
+        self.__timeout = StrictSession._session_timeout
+        # The (connect, read) timeout of the read-only requests. ClearML defaults the read
+        # timeout to 300 seconds, which makes a slow server hang the command.
+        if timeout is not None:
+            self._session_initial_timeout = timeout
+            self._session_timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    # The timeout ClearML applies to the requests after the first one, which depends on
+    # whether the request being sent by the thread is a mutating one
+    @property
+    def _session_timeout(self):
+        if getattr(self.__request_local, "mutating", False):
+            return (self.__timeout[0], WRITE_READ_TIMEOUT_SEC)
+        return self.__timeout
+
+    @_session_timeout.setter
+    def _session_timeout(self, timeout):
+        self.__timeout = timeout
+
+    # The retries of the http transport only apply to the mutating requests before they
+    # are sent, e.g. on connection errors. urllib3 doesn't retry the requests with a
+    # non-idempotent method after a read error, so they are sent as POST, which the
+    # server accepts for every action, instead of ClearML's default GET.
+    def _send_request(self, service, action, **kwargs):
+        mutating = not is_read_only_action(service, action)
+        if mutating:
+            kwargs["method"] = "POST"
+        outer_mutating = getattr(self.__request_local, "mutating", False)
+        self.__request_local.mutating = mutating
+        try:
+            return super()._send_request(service=service, action=action, **kwargs)
+        finally:
+            self.__request_local.mutating = outer_mutating
+
+    def refresh_token(self):
+        if not self.__cached_token_used:
+            self.__cached_token_used = True
+            token_entry = self.__load_token_cache().get(self.__get_cache_key())
+            if token_entry is not None and self._calc_token_valid_period_sec(
+                token_entry["token"], exp=token_entry["expires_at"]
+            ):
+                self._set_token(token_entry["token"])
+                return
+        super().refresh_token()
+        self.__save_token()
+
+    def __save_token(self):
+        now = time.time()
+        # Drop the expired tokens of other servers while at it
+        token_cache = {
+            key: token_entry
+            for key, token_entry in self.__load_token_cache().items()
+            if token_entry["expires_at"] > now
+        }
+        token_cache[self.__get_cache_key()] = {
+            "token": self.raw_token,
+            "expires_at": self.token_expiration_sec,
+        }
+        write_cache_file(get_cache_file_path(TOKEN_CACHE_FILE_NAME), token_cache)
+
+    def __load_token_cache(self):
+        return read_cache_file(get_cache_file_path(TOKEN_CACHE_FILE_NAME)) or {}
+
+    # Tokens are specific to the server and the credentials of the profile
+    def __get_cache_key(self):
+        return f"{self.host} {self.access_key}"
+
+
+def get_shared_session(
+    timeout=DEFAULT_TIMEOUT_SEC,
+    max_retries=DEFAULT_MAX_RETRIES,
+    pool_maxsize=DEFAULT_POOL_MAXSIZE,
+):
+    """
+    Get the API session shared by the whole process, creating it on the first call.
+    It's a single keep-alive connection pool, whose requests time out after `timeout`
+    (a (connect, read) tuple in seconds) and are retried up to `max_retries` times with
+    exponential backoff on connection errors and 5xx responses. The mutating requests
+    are only retried when they were not sent, and keep a long read timeout. Responses
+    are gzip compressed when the server supports it.
+    The session is also made the ClearML SDK's default session, so that e.g. Task
+    objects send their requests through the same transport and token.
+    """
+    global _shared_session
+    # The lock makes sure that the threads of a batch share a single session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = CachedTokenSession(
+                timeout=timeout,
+                http_retries_config={
+                    "total": max_retries,
+                    "connect": max_retries,
+                    "read": max_retries,
+                    "backoff_factor": DEFAULT_BACKOFF_FACTOR_SEC,
+                    "backoff_max": DEFAULT_BACKOFF_MAX_SEC,
+                    "pool_connections": pool_maxsize,
+                    "pool_maxsize": pool_maxsize,
+                },
+            )
+            InterfaceBase._set_default_session(_shared_session)
+    return _shared_session
+
+
+def get_configured_session(config_loader):
+    """
+    Get the shared API session, with the transport settings of the optional clenv.http
+    section of the config file loaded by config_loader
+    """
+    http_config = config_loader.get_config_values(
+        "clenv.http.connect_timeout_sec",
+        "clenv.http.read_timeout_sec",
+        "clenv.http.max_retries",
+        "clenv.http.pool_maxsize",
+        default=None,
+    )
+
+    # 0 is a valid value, e.g. to turn the retries off, only the missing keys default
+    def get_value(key, default):
+        value = http_config[key]
+        return default if value is None else value
+
+    return get_shared_session(
+        timeout=(
+            get_value("clenv.http.connect_timeout_sec", DEFAULT_TIMEOUT_SEC[0]),
+            get_value("clenv.http.read_timeout_sec", DEFAULT_TIMEOUT_SEC[1]),
+        ),
+        max_retries=get_value("clenv.http.max_retries", DEFAULT_MAX_RETRIES),
+        pool_maxsize=get_value("clenv.http.pool_maxsize", DEFAULT_POOL_MAXSIZE),
+    )
@@ -0,0 +1,184 @@
+import contextlib
+import math
+import sqlite3
+import time
+
+# The tasks enqueued by clenv wait in pending_tasks until their start time is known. Their
+# wait is then rolled up in a daily histogram per queue, and the task is forgotten, so
+# the size of the store and the cost of the queries grow with the number of days and
+# queues rather than with the number of tasks.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_tasks (
+    host TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    queue_id TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    PRIMARY KEY (host, task_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pending_tasks_enqueued_at
+    ON pending_tasks (host, enqueued_at);
+CREATE TABLE IF NOT EXISTS wait_histogram (
+    host TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    queue_id TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (host, day, queue_id, bucket)
+) WITHOUT ROWID;
+"""
+
+
+# The local history of the time the tasks waited in the queues of a server, from their
+# enqueue to their start
+class QueueLatencyHistory:
+    DB_FILE_NAME = "queue-latency.sqlite3"
+    SECONDS_PER_DAY = 86400
+    # The histogram buckets grow geometrically, the percentiles are accurate within 25%
+    BUCKET_BASE = 1.25
+    # A task not started after a week, e.g. it was dequeued, is not tracked anymore
+    MAX_PENDING_SEC = 7 * SECONDS_PER_DAY
+    RETENTION_DAYS = 365
+
+    def __init__(self, db_file_path, host):
+        self.__db_file_path = db_file_path
+        self.__host = host
+
+    # A connection in a transaction, committed and closed on exit. A connection is opened
+    # per operation so that the history can be used from several threads.
+    @contextlib.contextmanager
+    def __transaction(self):
+        conn = sqlite3.connect(self.__db_file_path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __bucket(self, wait_sec):
+        if wait_sec <= 0:
+            return 0
+        return math.ceil(math.log(wait_sec + 1, self.BUCKET_BASE))
+
+    # The upper bound of the waits of a bucket
+    def __bucket_wait_sec(self, bucket):
+        return self.BUCKET_BASE**bucket - 1
+
+    def record_enqueue(self, task_id, queue_id, enqueued_at=None):
+        with self.__transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pending_tasks VALUES (?, ?, ?, ?)",
+                (self.__host, task_id, queue_id, enqueued_at or time.time()),
+            )
+
+    def get_pending_task_ids(self):
+        """
+        Get the ids of the tasks whose start time is still unknown, the oldest first
+        """
+        now = time.time()
+        with self.__transaction() as conn:
+            conn.execute(
+                "DELETE FROM pending_tasks WHERE host = ? AND enqueued_at < ?",
+                (self.__host, now - self.MAX_PENDING_SEC),
+            )
+            conn.execute(
+                "DELETE FROM wait_histogram WHERE host = ? AND day < ?",
+                (self.__host, now // self.SECONDS_PER_DAY - self.RETENTION_DAYS),
+            )
+            rows = conn.execute(
+                "SELECT task_id FROM pending_tasks WHERE host = ? ORDER BY enqueued_at",
+                (self.__host,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def record_starts(self, starts):
+        """
+        Roll up the waits of pending tasks in the histogram.
+        :param starts: A dict of task id to the start timestamp of the task, or to None if
+            the task is not going to start, e.g. it was dequeued or deleted
+        """
+        if not starts:
+            return
+        with self.__transaction() as conn:
+            for task_id, started_at in starts.items():
+                row = conn.execute(
+                    "SELECT queue_id, enqueued_at FROM pending_tasks "
+                    + "WHERE host = ? AND task_id = ?",
+                    (self.__host, task_id),
+                ).fetchone()
+                if row is None:
+                    continue
+                conn.execute(
+                    "DELETE FROM pending_tasks WHERE host = ? AND task_id = ?",
+                    (self.__host, task_id),
+                )
+                queue_id, enqueued_at = row
+                # A start older than the enqueue is the one of a previous run of the task
+                if started_at is None or started_at < enqueued_at:
+                    continue
+                conn.execute(
+                    "INSERT INTO wait_histogram VALUES (?, ?, ?, ?, 1) "
+                    + "ON CONFLICT (host, day, queue_id, bucket) "
+                    + "DO UPDATE SET count = count + 1",
+                    (
+                        self.__host,
+                        int(enqueued_at // self.SECONDS_PER_DAY),
+                        queue_id,
+                        self.__bucket(started_at - enqueued_at),
+                    ),
+                )
+
+    def get_wait_percentiles(self, days=30, percentiles=(50, 90)):
+        """
+        Get the percentiles of the waits of the tasks enqueued in the last days, as a dict
+        of queue id to a dict with the number of tasks as "count", and the wait in seconds
+        of each percentile as e.g. "p50". Queues without history are left out.
+        """
+        first_day = int(time.time() // self.SECONDS_PER_DAY) - days + 1
+        with self.__transaction() as conn:
+            rows = conn.execute(
+                "SELECT queue_id, bucket, SUM(count) FROM wait_histogram "
+                + "WHERE host = ? AND day >= ? GROUP BY queue_id, bucket "
+                + "ORDER BY queue_id, bucket",
+                (self.__host, first_day),
+            ).fetchall()
+
+        histograms = {}
+        for queue_id, bucket, count in rows:
+            histograms.setdefault(queue_id, []).append((bucket, count))
+
+        stats = {}
+        for queue_id, histogram in histograms.items():
+            total = sum(count for _, count in histogram)
+            queue_stats = {"count": total}
+            for percentile in percentiles:
+                rank = percentile / 100 * total
+                cumulative = 0
+                for bucket, count in histogram:
+                    cumulative += count
+                    if cumulative >= rank:
+                        break
+                queue_stats[f"p{percentile}"] = round(self.__bucket_wait_sec(bucket), 1)
+            stats[queue_id] = queue_stats
+        return stats
+
+
+# Format a duration in seconds for display, e.g. 95 as "1m35s"
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds // 60 % 60:02d}m"
+
+
+# Format the wait percentiles of a queue for display
+def format_wait_stats(queue_stats):
+    if not queue_stats:
+        return "no history"
+    return (
+        f"p50 {format_duration(queue_stats['p50'])}, "
+        + f"p90 {format_duration(queue_stats['p90'])} ({queue_stats['count']} tasks)"
+    )
@@ -1,58 +1,360 @@
-from clearml.backend_api.session.client import APIClient
+from clenv.cli.cache import get_cache_file_path, read_cache_file, write_cache_file
 from clenv.cli.config.config_loader import ConfigLoader
-import requests
+from clenv.cli.api_client import ApiClient, is_daemon_session
+import hashlib
+import os
+import re
+import threading
+import time
 
 
 # Write a subcommand about the queue management
 class QueueManager:
+    GET_ALL = "queues.get_all"
     GET_ALL_EX = "queues.get_all_ex"
+    PAGE_SIZE = 100
+    # The fields of the queues kept in the snapshot
+    SNAPSHOT_FIELDS = ["id", "name", "workers"]
+    GET_QUEUE_METRICS = "queues.get_queue_metrics"
+    # The recent throughput of a queue is estimated from the metrics of the last hour
+    METRICS_WINDOW_SEC = 3600
+    METRICS_INTERVAL_SEC = 300
+    # The throughput assumed for every worker of a queue without usable metrics
+    ASSUMED_WORKER_THROUGHPUT_PER_MIN = 1.0
+    # For how long the daemon's queue snapshot is used, if snapshot_ttl_sec is 0
+    DAEMON_SNAPSHOT_TTL_SEC = 5
 
-    def __init__(self):
-        self.__client = APIClient(api_version="2.23")
-
-        # Initialize an http client using requests
-        self.__http_client = requests.Session()
-        self.__config_loader = ConfigLoader(config_file_path="~/clearml.conf")
+    def __init__(self, snapshot_ttl_sec=None):
+        """
+        :param snapshot_ttl_sec: For how long the queue snapshot is shared on disk with
+            the next clenv invocations. Defaults to the clenv.queue.snapshot_ttl_sec
+            config value, or 0, which disables the on-disk snapshot.
+        """
+        self.__config_loader = ConfigLoader()
         self.__config_loader.load()
 
-    def __refresh_token(self):
-        resp = self.__client.auth.login()
-        self.__token = resp.token
-
-    def __get_all_queues(self):
-        self.__refresh_token()
-        api_server_addr = self.__config_loader.get_config_value("api.api_server")
-        # Get JSON response from the API using the http client, the API url is /queues.get_all_ex
-        # Also, pass the token in the header
-        resp = self.__http_client.get(
-            f"{api_server_addr}/{self.GET_ALL_EX}",
-            headers={"Authorization": "Bearer " + self.__token},
-        )
+        # All the API calls go through the process wide session, which reuses the auth
+        # token cached by previous clenv invocations. The transport can be tuned in the
+        # optional clenv.http section of the config file. With the daemon enabled, the
+        # calls are sent by the daemon instead, and the SDK is not imported at all.
+        self.__api = ApiClient(self.__config_loader)
+        self.__session = self.__api.session
+        self.__uses_daemon = is_daemon_session(self.__session)
+
+        if snapshot_ttl_sec is None:
+            snapshot_ttl_sec = self.__config_loader.get_config_value(
+                "clenv.queue.snapshot_ttl_sec", 0
+            )
+        self.__snapshot_ttl_sec = snapshot_ttl_sec
+        # The queues fetched once per command, indexed by name and by id. The lock makes
+        # sure that concurrent submissions fetch it only once.
+        self.__snapshot = None
+        self.__snapshot_lock = threading.Lock()
+        self.__refresh_daemon_snapshot = False
+
+    # Iterate over the queues matching the filters, one page at a time, so that memory
+    # scales with the page size rather than with the number of queues on the server.
+    # Only the fields in only_fields are returned by the server. The queues.get_all_ex
+    # endpoint also returns the workers of each queue, queues.get_all doesn't.
+    def __iter_queues(self, only_fields, endpoint=GET_ALL_EX, **filters):
+        page = 0
+        while True:
+            resp = self.__api.send_request(
+                endpoint,
+                {
+                    "only_fields": only_fields,
+                    "page": page,
+                    "page_size": self.PAGE_SIZE,
+                    **filters,
+                },
+            )
+            queues = resp.get("queues")
+            yield from queues
+            if len(queues) < self.PAGE_SIZE:
+                return
+            page += 1
+
+    # Get the snapshot of the queues, fetching it on the first call. The snapshot is read
+    # from the disk instead if a previous invocation saved it less than snapshot_ttl_sec
+    # seconds ago.
+    def __get_snapshot(self):
+        with self.__snapshot_lock:
+            return self.__load_snapshot()
+
+    def __load_snapshot(self):
+        if self.__snapshot is not None:
+            return self.__snapshot
+        if self.__uses_daemon:
+            # The daemon holds the snapshot in memory, shared by all the commands
+            max_age_sec = self.__snapshot_ttl_sec or self.DAEMON_SNAPSHOT_TTL_SEC
+            if self.__refresh_daemon_snapshot:
+                max_age_sec = 0
+                self.__refresh_daemon_snapshot = False
+            self.__snapshot = self.__index_queues(
+                self.__session.get_queues(max_age_sec)
+            )
+            return self.__snapshot
+        cache_file_path = self.__get_snapshot_cache_file_path()
+        if self.__snapshot_ttl_sec > 0:
+            cache = read_cache_file(cache_file_path)
+            if (
+                cache is not None
+                and time.time() - cache["fetched_at"] < self.__snapshot_ttl_sec
+            ):
+                self.__snapshot = self.__index_queues(cache["queues"])
+                return self.__snapshot
+
+        queues = list(self.__iter_queues(self.SNAPSHOT_FIELDS))
+        if self.__snapshot_ttl_sec > 0:
+            write_cache_file(
+                cache_file_path, {"fetched_at": time.time(), "queues": queues}
+            )
+        self.__snapshot = self.__index_queues(queues)
+        return self.__snapshot
 
-        # Get the queues from the response
-        return resp.json().get("data").get("queues")
+    def __index_queues(self, queues):
+        return {
+            "queues": queues,
+            "by_name": {queue["name"]: queue for queue in queues},
+            "by_id": {queue["id"]: queue for queue in queues},
+        }
 
-    def __get_queue_simple_details_by_id(self, queue_id):
-        queue = self.__client.queues.get_by_id(queue_id)
-        # Convert queue to a dict object
-        return queue
+    # The snapshot is specific to the server
+    def __get_snapshot_cache_file_path(self):
+        host_hash = hashlib.sha1(self.__session.host.encode("utf-8"))
+        return get_cache_file_path(f"queues-{host_hash.hexdigest()[:16]}.json")
+
+    def refresh(self):
+        """
+        Drop the queue snapshot, including the one on disk, so that the next call fetches
+        the queues from the server again
+        """
+        self.__snapshot = None
+        self.__refresh_daemon_snapshot = self.__uses_daemon
+        try:
+            os.remove(self.__get_snapshot_cache_file_path())
+        except FileNotFoundError:
+            pass
 
     def get_all_queue_names(self):
-        # Iterate queues, get the queue names
-        queues = self.__get_all_queues()
-        queue_names = [queue.name for queue in queues]
+        # Iterate queues, get the queue names. Unless the snapshot is already there, only
+        # the names are fetched
+        if self.__snapshot is not None:
+            return [queue["name"] for queue in self.__snapshot["queues"]]
+        queues = self.__iter_queues(["name"], endpoint=self.GET_ALL)
+        queue_names = [queue["name"] for queue in queues]
         return queue_names
 
+    def get_all_queues(self):
+        """
+        Get the queues from the snapshot, as dicts with the id, name and workers of the
+        queue
+        """
+        return self.__get_snapshot()["queues"]
+
+    def iter_queue_loads(self):
+        """
+        Fetch the current load of the queues from the server, bypassing the snapshot. Yield
+        a dict per queue, with the id, the name, and the numbers of workers, idle workers
+        and pending entries of the queue.
+        """
+        for queue in self.__iter_queues(["id", "name", "workers", "entries"]):
+            yield {
+                "id": queue["id"],
+                "name": queue["name"],
+                "workers": len(queue["workers"]),
+                "idle_workers": len(
+                    [
+                        worker
+                        for worker in queue["workers"]
+                        if worker.get("task") is None
+                    ]
+                ),
+                "pending": len(queue.get("entries") or []),
+            }
+
+    def get_queue(self, queue_name=None, queue_id=None):
+        """
+        Get the queue with the given name or id from the snapshot, as a dict with the
+        id, name and workers of the queue. Return None if there is no such queue.
+        """
+        snapshot = self.__get_snapshot()
+        if queue_id is not None and queue_id in snapshot["by_id"]:
+            return snapshot["by_id"][queue_id]
+        return snapshot["by_name"].get(queue_name)
+
     def get_queue_simple_details(self, queue_name, queue_id=None):
-        queues = self.__get_all_queues()
-        for queue in queues:
-            if queue.name == queue_name or queue.id == queue_id:
-                return self.__get_queue_simple_details_by_id(queue.id)
+        return self.get_queue(queue_name, queue_id)
 
     def get_available_queues(self):
-        queues = self.__get_all_queues()
+        queues = self.__get_snapshot()["queues"]
         # Filter out the queues that are not available, which means the queue.workers is an not an empty list
         return [queue for queue in queues if queue["workers"]]
 
+    def score_queues(self, queue_names=None):
+        """
+        Score the candidate queues by the expected wait of a task enqueued now, from the
+        idle workers, the pending entries and the recent throughput of each queue. The
+        candidates default to the queues with workers. Return the score breakdown of each
+        candidate as a dict, the shortest expected wait first.
+        """
+        if queue_names is None:
+            candidates = self.get_available_queues()
+        else:
+            candidates = [self.get_queue(queue_name) for queue_name in queue_names]
+            missing_queue_names = [
+                queue_name
+                for queue_name, queue in zip(queue_names, candidates)
+                if queue is None
+            ]
+            if missing_queue_names:
+                raise Exception(f"Queues {missing_queue_names} do not exist")
+        if not candidates:
+            return []
+
+        # The entries are only fetched for the candidates, they are not in the snapshot
+        queue_ids = [queue["id"] for queue in candidates]
+        pending = {
+            queue["id"]: len(queue.get("entries") or [])
+            for queue in self.__iter_queues(["id", "entries"], id=queue_ids)
+        }
+        throughputs = self.__get_throughputs(queue_ids)
+
+        scores = []
+        for queue in candidates:
+            workers = len(queue["workers"])
+            idle_workers = len(
+                [worker for worker in queue["workers"] if worker.get("task") is None]
+            )
+            throughput_per_min = throughputs.get(queue["id"])
+            throughput_source = "history"
+            if throughput_per_min is None:
+                throughput_per_min = workers * self.ASSUMED_WORKER_THROUGHPUT_PER_MIN
+                throughput_source = "assumed"
+            score = {
+                "queue": queue["name"],
+                "queue_id": queue["id"],
+                "workers": workers,
+                "idle_workers": idle_workers,
+                "pending": pending.get(queue["id"], 0),
+                "throughput_per_min": round(throughput_per_min, 2),
+                "throughput_source": throughput_source,
+            }
+            # An idle worker picks the task right away if there are more idle workers than
+            # pending entries, otherwise the task waits for the ones ahead of it to start
+            ahead = score["pending"] - idle_workers + 1
+            if workers == 0:
+                # The throughput of the last hour was the one of workers gone since
+                score["expected_wait_sec"] = None
+            elif ahead <= 0:
+                score["expected_wait_sec"] = 0.0
+            elif throughput_per_min > 0:
+                score["expected_wait_sec"] = round(ahead * 60 / throughput_per_min, 1)
+            else:
+                score["expected_wait_sec"] = None
+            scores.append(score)
+
+        scores.sort(
+            key=lambda score: (
+                score["expected_wait_sec"] is None,
+                score["expected_wait_sec"] or 0,
+                -score["idle_workers"],
+                score["pending"],
+            )
+        )
+        return scores
+
+    def select_queue(self, queue_names=None):
+        """
+        Select the candidate queue with the shortest expected wait. Return the queue, or
+        None if no candidate has workers, and the score breakdown of all the candidates.
+        """
+        scores = self.score_queues(queue_names)
+        if not scores or scores[0]["expected_wait_sec"] is None:
+            return None, scores
+        return self.get_queue(queue_id=scores[0]["queue_id"]), scores
+
+    # The latency history of the queues of the server. The SQLite store lives in the
+    # cache directory.
+    def __get_latency_history(self):
+        from clenv.cli.queue.latency_history import QueueLatencyHistory
+
+        return QueueLatencyHistory(
+            get_cache_file_path(QueueLatencyHistory.DB_FILE_NAME),
+            self.__session.host,
+        )
+
+    def record_enqueue(self, task_id, queue_id):
+        """
+        Record in the latency history that a task was enqueued now
+        """
+        import sqlite3
+
+        # The history is best effort, it never fails a submission
+        try:
+            self.__get_latency_history().record_enqueue(task_id, queue_id)
+        except sqlite3.Error:
+            pass
+
+    def get_wait_stats(self, days=30):
+        """
+        Get the p50 and p90 time to start of the tasks enqueued in the last days, from
+        the latency history, as a dict of queue id to a dict with the "count", "p50" and
+        "p90" keys. The start times of the tasks that were still pending are fetched
+        from the server first.
+        """
+        from clenv.cli.task.task_manager import to_timestamp
+
+        history = self.__get_latency_history()
+        task_ids = history.get_pending_task_ids()
+        starts = {}
+        for i in range(0, len(task_ids), self.PAGE_SIZE):
+            page_task_ids = task_ids[i : i + self.PAGE_SIZE]
+            # The tasks missing from the response were deleted
+            starts.update({task_id: None for task_id in page_task_ids})
+            resp = self.__api.send_request(
+                "tasks.get_all",
+                {"id": page_task_ids, "only_fields": ["id", "status", "started"]},
+            )
+            for task in resp.get("tasks"):
+                if task.get("status") == "queued":
+                    # Still waiting
+                    del starts[task["id"]]
+                elif task.get("started"):
+                    starts[task["id"]] = to_timestamp(task["started"])
+        history.record_starts(starts)
+        return history.get_wait_percentiles(days)
+
+    # Estimate the recent throughput of the queues, in tasks per minute, from the average
+    # length and waiting time of their entries with Little's law. A queue whose tasks
+    # never waited, or without metrics, has no estimate.
+    def __get_throughputs(self, queue_ids):
+        now = time.time()
+        try:
+            resp = self.__api.send_request(
+                self.GET_QUEUE_METRICS,
+                {
+                    "from_date": now - self.METRICS_WINDOW_SEC,
+                    "to_date": now,
+                    "interval": self.METRICS_INTERVAL_SEC,
+                    "queue_ids": queue_ids,
+                },
+            )
+        except Exception:
+            # The metrics are optional, e.g. the server doesn't keep them
+            return {}
+
+        throughputs = {}
+        for metrics in resp.get("queues") or []:
+            lengths = metrics.get("queue_lengths") or []
+            waiting_times = metrics.get("avg_waiting_times") or []
+            if not lengths or not waiting_times:
+                continue
+            avg_length = sum(lengths) / len(lengths)
+            avg_waiting_sec = sum(waiting_times) / len(waiting_times)
+            if avg_length > 0 and avg_waiting_sec > 0:
+                throughputs[metrics["queue"]] = avg_length / avg_waiting_sec * 60
+        return throughputs
+
     # def list_queues_as_table(self):
     # queue_detail_list = self.list_queues()
@@ -0,0 +1,144 @@
+import click
+import sys
+
+# Write a subcommand about the queue management
+# The ClearML SDK is heavy to import, so the queue manager is imported inside the commands
+
+
+@click.group(help="Queue management")
+def queue():
+    pass
+
+
+@queue.command(
+    help="Show the predicted time to start of a task in each queue. \n\nThe prediction "
+    + "is the p50 and p90 of the time the tasks enqueued by clenv waited before they "
+    + "started, which is recorded locally."
+)
+@click.option(
+    "--days",
+    default=30,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Only use the tasks enqueued in the last days",
+)
+def stats(days):
+    from clenv.cli.queue.queue_manager import QueueManager
+    from clenv.cli.queue.latency_history import format_wait_stats
+
+    queue_manager = QueueManager()
+    wait_stats = queue_manager.get_wait_stats(days)
+    queues = queue_manager.get_all_queues()
+    if not queues:
+        click.echo("No queues", err=True)
+        return
+
+    name_width = max(len(queue["name"]) for queue in queues)
+    for queue in queues:
+        click.echo(
+            f"{queue['name']:<{name_width}}  {len(queue['workers'])} workers  "
+            + format_wait_stats(wait_stats.get(queue["id"]))
+        )
+
+
+@queue.command(
+    help="Watch the workers and the pending tasks of the queues, refreshed every few "
+    + "seconds. \n\nOnly the rows of the queues whose load changed are redrawn. When the "
+    + "output is not a terminal, a line is printed per change instead."
+)
+@click.option(
+    "--interval",
+    default=5.0,
+    show_default=True,
+    type=click.FloatRange(min=1),
+    help="Seconds between two refreshes",
+)
+@click.option(
+    "--max-interval",
+    default=60.0,
+    show_default=True,
+    type=click.FloatRange(min=1),
+    help="Longest time between two refreshes, reached while the server is slow or failing",
+)
+def watch(interval, max_interval):
+    from clenv.cli.queue.queue_manager import QueueManager
+    import time
+
+    queue_manager = QueueManager()
+    interactive = sys.stdout.isatty()
+    # Only the rows of the last refresh are kept, by queue id in display order
+    rows = {}
+    poll_interval = interval
+    try:
+        while True:
+            start = time.monotonic()
+            try:
+                loads = list(queue_manager.iter_queue_loads())
+                error = None
+            except Exception as e:
+                loads = None
+                error = str(e)
+            latency = time.monotonic() - start
+            # Back off while the server is slow or failing, and come back to the interval
+            # once it recovers
+            if error is not None or latency > poll_interval / 2:
+                poll_interval = min(poll_interval * 2, max_interval)
+            else:
+                poll_interval = max(poll_interval / 2, interval)
+
+            status = f"{time.strftime('%H:%M:%S')} "
+            if error is not None:
+                status += f"refresh failed: {error}"
+            else:
+                status += f"refreshed in {latency:.2f}s"
+            status += f", next refresh in {poll_interval:.0f}s"
+
+            if loads is not None:
+                new_rows = {load["id"]: format_queue_load(load) for load in loads}
+            else:
+                new_rows = rows
+            if interactive:
+                draw_queue_loads(rows, new_rows, status)
+            else:
+                for load in loads or []:
+                    if rows.get(load["id"]) != new_rows[load["id"]]:
+                        click.echo(
+                            f"{time.strftime('%H:%M:%S')} {load['name']}: "
+                            + f"{load['idle_workers']}/{load['workers']} idle workers, "
+                            + f"{load['pending']} pending"
+                        )
+                if error is not None:
+                    click.echo(status, err=True)
+            rows = new_rows
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+QUEUE_LOAD_HEADER = f"{'QUEUE':<32}  {'IDLE':>4}  {'WORKERS':>7}  {'PENDING':>7}"
+
+
+def format_queue_load(load):
+    return (
+        f"{load['name']:<32}  {load['idle_workers']:>4}  {load['workers']:>7}  "
+        + f"{load['pending']:>7}"
+    )
+
+
+# Draw the queue load table on the terminal. The whole table is drawn when the queues
+# changed, otherwise only the rows that changed and the status line are rewritten in
+# place, with ANSI escape codes.
+def draw_queue_loads(rows, new_rows, status):
+    if list(rows) != list(new_rows):
+        click.clear()
+        click.echo(QUEUE_LOAD_HEADER)
+        for row in new_rows.values():
+            click.echo(row)
+        click.echo(status, nl=False)
+        return
+
+    # The header is on the first line of the terminal, the rows below it
+    for line, (queue_id, row) in enumerate(new_rows.items(), start=2):
+        if rows[queue_id] != row:
+            click.echo(f"\x1b[{line};1H\x1b[2K{click.style(row, bold=True)}", nl=False)
+    click.echo(f"\x1b[{len(new_rows) + 2};1H\x1b[2K{status}", nl=False)
@@ -0,0 +1,133 @@
+import os
+import re
+import subprocess
+
+SHA_PATTERN = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+SECTION_PATTERN = re.compile(r'^\[\s*([^\s"\]]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]')
+
+
+# A reader of the git metadata a task is created from: the branch, the commit and the
+# remote URL. They are read from the files of the .git directory, HEAD, the refs,
+# packed-refs and the config, instead of through GitPython, which runs git processes and
+# loads the whole repo config. Linked worktrees, whose .git is a file, are supported.
+class GitReader:
+    def __init__(self, path="."):
+        self.__work_tree = path
+        self.__git_dir = self.__find_git_dir(path)
+        # The refs and the config of a linked worktree are in the main repo
+        self.__common_dir = self.__git_dir
+        common_dir = self.__read_file(os.path.join(self.__git_dir, "commondir"))
+        if common_dir is not None:
+            self.__common_dir = os.path.normpath(
+                os.path.join(self.__git_dir, common_dir)
+            )
+
+    def __find_git_dir(self, path):
+        dot_git = os.path.join(path, ".git")
+        if os.path.isdir(dot_git):
+            return dot_git
+        content = self.__read_file(dot_git)
+        if content is not None and content.startswith("gitdir:"):
+            return os.path.normpath(
+                os.path.join(path, content[len("gitdir:") :].strip())
+            )
+        raise Exception(f"{os.path.abspath(path)} is not the root of a git repository")
+
+    # The stripped content of a file, or None if it doesn't exist
+    def __read_file(self, file_path):
+        try:
+            with open(file_path, "r") as f:
+                return f.read().strip()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def __read_packed_refs(self):
+        packed_refs = {}
+        content = self.__read_file(os.path.join(self.__common_dir, "packed-refs"))
+        for line in (content or "").splitlines():
+            # Skip the header and the peeled tags
+            if line.startswith(("#", "^")):
+                continue
+            sha, _, ref = line.partition(" ")
+            packed_refs[ref.strip()] = sha
+        return packed_refs
+
+    def __resolve_ref(self, ref, depth=0):
+        if SHA_PATTERN.match(ref):
+            return ref
+        if depth > 5:
+            return None
+        for git_dir in (self.__git_dir, self.__common_dir):
+            content = self.__read_file(os.path.join(git_dir, ref))
+            if content is not None:
+                break
+        else:
+            content = self.__read_packed_refs().get(ref)
+        if content is None:
+            return None
+        if content.startswith("ref:"):
+            return self.__resolve_ref(content[len("ref:") :].strip(), depth + 1)
+        return content
+
+    def get_head(self):
+        """
+        Get the branch and the commit checked out, as a (branch, commit) tuple. The branch
+        is None when the HEAD is detached, and the commit is None when the branch has no
+        commit yet.
+        """
+        head = self.__read_file(os.path.join(self.__git_dir, "HEAD")) or ""
+        if head.startswith("ref:"):
+            ref = head[len("ref:") :].strip()
+            branch = ref[len("refs/heads/") :] if ref.startswith("refs/heads/") else ref
+            return branch, self.__resolve_ref(ref)
+        return None, head or None
+
+    def get_remote_url(self, remote="origin"):
+        """
+        Get the URL of a remote, or None if the remote isn't configured
+        """
+        section = None
+        content = self.__read_file(os.path.join(self.__common_dir, "config"))
+        for line in (content or "").splitlines():
+            line = line.strip()
+            match = SECTION_PATTERN.match(line)
+            if match:
+                section = (match.group(1).lower(), match.group(2))
+                line = line[match.end() :].strip()
+            if section != ("remote", remote) or "=" not in line:
+                continue
+            key, _, value = line.partition("=")
+            if key.strip().lower() == "url":
+                value = re.split(r"\s[;#]", value.strip())[0].strip()
+                return value[1:-1] if value.startswith('"') else value
+        return None
+
+    def is_pushed(self, commit, remote="origin"):
+        """
+        Check whether a commit is on a branch of the remote, as of the last fetch. Return
+        None if that's unknown, e.g. git isn't installed.
+        """
+        prefix = f"refs/remotes/{remote}/"
+        remote_refs_dir = os.path.join(self.__common_dir, prefix)
+        for root, _, file_names in os.walk(remote_refs_dir):
+            for file_name in file_names:
+                ref = os.path.relpath(os.path.join(root, file_name), self.__common_dir)
+                if self.__resolve_ref(ref.replace(os.sep, "/")) == commit:
+                    return True
+        for ref, sha in self.__read_packed_refs().items():
+            if ref.startswith(prefix) and sha == commit:
+                return True
+        # The commit is not the tip of a remote branch, it may be one of their ancestors
+        try:
+            result = subprocess.run(
+                ["git", "branch", "--remotes", "--contains", commit]
+                + ["--list", f"{remote}/*"],
+                cwd=self.__work_tree,
+                capture_output=True,
+                text=True,
+            )
+        except OSError:
+            return None
+        if result.returncode != 0:
+            return None
+        return bool(result.stdout.strip())
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import subprocess
+import time
+
+from clenv.cli.cache import read_cache_file, write_cache_file
+
+
+# The requirements detected from the imports of the entrypoint scripts of a repo, cached
+# in ./.clenv by the content of what the detection reads: the script and the python files
+# tracked by git, including their uncommitted changes. The detection scans the whole repo,
+# which is the slowest local step of populating a task on a large repo.
+class RequirementsCache:
+    CACHE_FILE_PATH = "./.clenv/requirements_cache.json"
+    # The oldest entries are evicted above this number of entries
+    MAX_ENTRIES = 32
+    SOURCE_PATTERNS = ["*.py", "*.ipynb"]
+
+    def __init__(self, cache_file_path=CACHE_FILE_PATH):
+        self.__cache_file_path = cache_file_path
+
+    def __load(self):
+        entries = read_cache_file(self.__cache_file_path)
+        return entries if isinstance(entries, dict) else {}
+
+    def get_key(self, script_path):
+        """
+        Get the content address of the requirements of a script of the git repo in the
+        current directory
+        """
+        key = hashlib.sha256()
+        with open(script_path, "rb") as f:
+            key.update(os.path.normpath(script_path).encode("utf-8") + b"\0")
+            key.update(f.read() + b"\0")
+        # The blob ids of the tracked files, and the changes not staged yet
+        for git_args in (["ls-files", "--stage"], ["diff", "--no-ext-diff"]):
+            key.update(
+                subprocess.run(
+                    ["git"] + git_args + ["--"] + self.SOURCE_PATTERNS,
+                    capture_output=True,
+                    check=True,
+                ).stdout
+            )
+            key.update(b"\0")
+        return key.hexdigest()
+
+    def get(self, key):
+        """
+        Get the cached requirements of a key, as a list of requirement lines, or None
+        """
+        entry = self.__load().get(key)
+        if not isinstance(entry, dict):
+            return None
+        return entry.get("packages")
+
+    def put(self, key, packages):
+        entries = self.__load()
+        entries[key] = {"packages": packages, "created_at": time.time()}
+        if len(entries) > self.MAX_ENTRIES:
+            by_age = sorted(entries, key=lambda k: entries[k].get("created_at", 0))
+            for old_key in by_age[: len(entries) - self.MAX_ENTRIES]:
+                del entries[old_key]
+        os.makedirs(os.path.dirname(self.__cache_file_path), exist_ok=True)
+        write_cache_file(self.__cache_file_path, entries)
+
+
+# Detect the requirements of a script from its imports and the imports of the local
+# modules it uses, like clearml does for a task running locally. Return the list of
+# requirement lines.
+def detect_requirements(repo_root, script_path):
+    from clearml.backend_interface.task.repo.scriptinfo import ScriptRequirements
+
+    requirements, _ = ScriptRequirements(repo_root).get_requirements(
+        entry_point_filename=os.path.abspath(script_path),
+        add_missing_installed_packages=True,
+        detailed_req_report=False,
+    )
+    return [
+        line.strip()
+        for line in (requirements or "").splitlines()
+        if line.strip() and not line.lstrip().startswith("#")
+    ]
@@ -0,0 +1,135 @@
+import os
+import socket
+import time
+import uuid
+
+from clenv.cli.cache import read_cache_file, write_cache_file
+
+
+# The submissions of exec, written to ./.clenv/spool before they are sent to the server,
+# so that none is lost when the server is slow or unreachable. An entry is a json file,
+# renamed with the .flushing suffix by the process sending it. The rename is atomic, so
+# the processes flushing the spool concurrently never send an entry twice. The claimed
+# entry records the process that owns it, and is pending again once that process died.
+class SubmissionSpool:
+    SPOOL_DIR = "./.clenv/spool"
+    ENTRY_SUFFIX = ".json"
+    CLAIMED_SUFFIX = ".flushing"
+    # The owner of a claim made on another host, e.g. on a shared file system, can't be
+    # checked. Its claim is released once older than that.
+    CLAIM_TIMEOUT_SEC = 600
+
+    def __init__(self, spool_dir=SPOOL_DIR):
+        self.__spool_dir = spool_dir
+
+    def __get_entry_file_path(self, entry_id, claimed=False):
+        suffix = self.CLAIMED_SUFFIX if claimed else self.ENTRY_SUFFIX
+        return os.path.join(self.__spool_dir, entry_id + suffix)
+
+    # Whether the process owning a claimed entry is known to have died
+    def __is_owner_dead(self, entry, file_path):
+        owner = (entry or {}).get("owner")
+        if owner is None or owner.get("host") != socket.gethostname():
+            return time.time() - os.path.getmtime(file_path) > self.CLAIM_TIMEOUT_SEC
+        try:
+            os.kill(owner["pid"], 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            # The process exists, run by another user
+            pass
+        return False
+
+    # Make the entries of the processes that died while sending them pending again
+    def __release_stale_claims(self, file_names):
+        for file_name in file_names:
+            if not file_name.endswith(self.CLAIMED_SUFFIX):
+                continue
+            file_path = os.path.join(self.__spool_dir, file_name)
+            try:
+                if self.__is_owner_dead(read_cache_file(file_path), file_path):
+                    entry_id = file_name[: -len(self.CLAIMED_SUFFIX)]
+                    os.rename(file_path, self.__get_entry_file_path(entry_id))
+            except FileNotFoundError:
+                pass
+
+    def get_log_file_path(self):
+        return os.path.join(self.__spool_dir, "flush.log")
+
+    def add(self, submission):
+        """
+        Spool a submission, a json serializable dict. Return the id of the entry.
+        """
+        os.makedirs(self.__spool_dir, exist_ok=True)
+        # The ids sort in the order the entries were added. The time is in nanoseconds,
+        # the entries added within the same millisecond would otherwise sort by their
+        # random suffix
+        entry_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        entry = dict(submission, id=entry_id, created_at=time.time(), attempts=0)
+        write_cache_file(self.__get_entry_file_path(entry_id), entry)
+        return entry_id
+
+    def get_entries(self):
+        """
+        Get the spooled entries, the oldest first. The "state" of an entry is "pending",
+        or "flushing" while a process sends it.
+        """
+        try:
+            file_names = os.listdir(self.__spool_dir)
+        except FileNotFoundError:
+            return []
+        self.__release_stale_claims(file_names)
+
+        entries = []
+        for file_name in sorted(os.listdir(self.__spool_dir)):
+            for suffix, state in (
+                (self.ENTRY_SUFFIX, "pending"),
+                (self.CLAIMED_SUFFIX, "flushing"),
+            ):
+                if file_name.endswith(suffix):
+                    entry = read_cache_file(os.path.join(self.__spool_dir, file_name))
+                    if entry is not None:
+                        entries.append(dict(entry, state=state))
+        return entries
+
+    def claim(self, entry_id):
+        """
+        Claim an entry before sending it. Return the entry, or None if it's claimed by
+        another process, or it was sent already.
+        """
+        claimed_file_path = self.__get_entry_file_path(entry_id, claimed=True)
+        try:
+            os.rename(self.__get_entry_file_path(entry_id), claimed_file_path)
+        except FileNotFoundError:
+            return None
+        # The age of the claim is the modification time of the file, until the owner is
+        # recorded
+        os.utime(claimed_file_path)
+        entry = read_cache_file(claimed_file_path)
+        if entry is not None:
+            entry["owner"] = {"pid": os.getpid(), "host": socket.gethostname()}
+            write_cache_file(claimed_file_path, entry)
+        return entry
+
+    def update(self, entry):
+        """
+        Write a claimed entry, e.g. once its task is created, so that a retry doesn't
+        create it again
+        """
+        write_cache_file(self.__get_entry_file_path(entry["id"], claimed=True), entry)
+
+    def release(self, entry, error):
+        """
+        Make a claimed entry pending again, after its submission failed with error
+        """
+        entry = dict(entry, attempts=entry["attempts"] + 1, last_error=error)
+        entry.pop("owner", None)
+        claimed_file_path = self.__get_entry_file_path(entry["id"], claimed=True)
+        write_cache_file(claimed_file_path, entry)
+        os.rename(claimed_file_path, self.__get_entry_file_path(entry["id"]))
+
+    def remove(self, entry):
+        """
+        Remove a claimed entry, once it's sent
+        """
+        os.remove(self.__get_entry_file_path(entry["id"], claimed=True))
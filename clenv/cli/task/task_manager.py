@@ -0,0 +1,189 @@
+from clenv.cli.cache import get_cache_file_path, read_cache_file, write_cache_file
+from clenv.cli.config.config_loader import ConfigLoader
+from clenv.cli.api_client import ApiClient
+import copy
+import hashlib
+import re
+
+# The project ids by name, by server host, shared by the task managers of the process
+PROJECT_IDS_CACHE = {}
+
+
+# Task operations sent straight to the ClearML API, for the commands handling many tasks
+# at once, where the ClearML SDK Task objects would cost several requests per task
+class TaskManager:
+    # The maximum number of console events returned by one get_task_log call
+    LOG_BATCH_SIZE = 500
+    PAGE_SIZE = 100
+    # The maximum number of tasks sent in one request of the tasks.*_many endpoints
+    BULK_CHUNK_SIZE = 100
+
+    def __init__(self):
+        self.__config_loader = ConfigLoader()
+        self.__config_loader.load()
+
+        # The same process wide session as the QueueManager
+        self.__api = ApiClient(self.__config_loader)
+        self.__session = self.__api.session
+
+    def iter_tasks(self, only_fields, **filters):
+        """
+        Iterate over the tasks matching the tasks.get_all filters, one page at a time.
+        Only the fields in only_fields are returned by the server.
+        """
+        page = 0
+        while True:
+            resp = self.__api.send_request(
+                "tasks.get_all",
+                {
+                    "only_fields": only_fields,
+                    "page": page,
+                    "page_size": self.PAGE_SIZE,
+                    **filters,
+                },
+            )
+            tasks = resp["tasks"]
+            yield from tasks
+            if len(tasks) < self.PAGE_SIZE:
+                return
+            page += 1
+
+    def get_current_user_id(self):
+        return self.__api.send_request("users.get_current_user")["user"]["id"]
+
+    def __get_project_ids_cache_file_path(self):
+        host_hash = hashlib.sha1(self.__session.host.encode("utf-8"))
+        return get_cache_file_path(f"project-ids-{host_hash.hexdigest()[:16]}.json")
+
+    def get_project_id(self, project_name, refresh=False):
+        """
+        Get the id of the project with the given name, or None if there is no such project.
+        The ids are cached per server, in the process and on disk. With refresh, the id is
+        looked up on the server again, e.g. when the cached project wasn't found.
+        """
+        project_ids = PROJECT_IDS_CACHE.get(self.__session.host)
+        if project_ids is None:
+            project_ids = read_cache_file(self.__get_project_ids_cache_file_path())
+            if not isinstance(project_ids, dict):
+                project_ids = {}
+            PROJECT_IDS_CACHE[self.__session.host] = project_ids
+        if not refresh and project_name in project_ids:
+            return project_ids[project_name]
+
+        resp = self.__api.send_request(
+            "projects.get_all",
+            {"name": f"^{re.escape(project_name)}$", "only_fields": ["id", "name"]},
+        )
+        project_id = None
+        for project in resp["projects"]:
+            if project["name"] == project_name:
+                project_id = project["id"]
+                break
+        # A project not found is not cached, it may be created any time
+        if project_id is None:
+            project_ids.pop(project_name, None)
+        else:
+            project_ids[project_name] = project_id
+        write_cache_file(self.__get_project_ids_cache_file_path(), project_ids)
+        return project_id
+
+    def get_hyperparams(self, task_id):
+        """
+        Get the hyperparameters of a task, as a dict of section to a dict of name to
+        parameter, e.g. {"Args": {"lr": {"section": "Args", "name": "lr", "value": "0.1"}}}
+        """
+        resp = self.__api.send_request(
+            "tasks.get_all", {"id": [task_id], "only_fields": ["hyperparams"]}
+        )
+        if not resp["tasks"]:
+            raise Exception(f"Task {task_id} does not exist")
+        return resp["tasks"][0].get("hyperparams") or {}
+
+    def clone_task(self, task_id, name, hyperparams=None, overrides=None):
+        """
+        Clone a task in a single request, and return the id of the new task.
+        :param hyperparams: The hyperparameters of the source task, as returned by
+            get_hyperparams(). Required when overrides is given.
+        :param overrides: A dict of "<section>/<name>" to value of the hyperparameters
+            overridden in the new task, e.g. {"Args/lr": "0.001"}
+        """
+        payload = {"task": task_id, "new_task_name": name}
+        if overrides:
+            new_hyperparams = copy.deepcopy(hyperparams)
+            for key, value in overrides.items():
+                section, param_name = key.split("/", 1)
+                param = new_hyperparams.setdefault(section, {}).setdefault(
+                    param_name, {"section": section, "name": param_name}
+                )
+                param["value"] = str(value)
+            payload["new_task_hyperparams"] = new_hyperparams
+        return self.__api.send_request("tasks.clone", payload)["id"]
+
+    def enqueue_task(self, task_id, queue_id):
+        self.__api.send_request("tasks.enqueue", {"task": task_id, "queue": queue_id})
+
+    def delete_task(self, task_id):
+        self.__api.send_request("tasks.delete", {"task": task_id, "force": True})
+
+    def get_task_statuses(self, task_ids):
+        """
+        Get the status of the tasks, as a dict of task id to status. The tasks that don't
+        exist are left out.
+        """
+        resp = self.__api.send_request(
+            "tasks.get_all", {"id": list(task_ids), "only_fields": ["id", "status"]}
+        )
+        return {task["id"]: task["status"] for task in resp["tasks"]}
+
+    def get_task_log(self, task_id, from_timestamp=None):
+        """
+        Get the console events of a task, the oldest first, at most LOG_BATCH_SIZE of them.
+        :param from_timestamp: Only get the events reported after this timestamp, in
+            epoch ms, e.g. the timestamp of the last event already fetched
+        """
+        payload = {
+            "task": task_id,
+            "batch_size": self.LOG_BATCH_SIZE,
+            "navigate_earlier": False,
+        }
+        if from_timestamp is not None:
+            payload["from_timestamp"] = from_timestamp
+        return self.__api.send_request("events.get_task_log", payload)["events"]
+
+    # Send a request of a tasks.*_many endpoint. Return the ids of the tasks it succeeded
+    # for, and a dict of task id to error message for the tasks it failed for.
+    def __send_many_request(self, endpoint, task_ids, **params):
+        resp = self.__api.send_request(endpoint, {"ids": list(task_ids), **params})
+        succeeded = [task["id"] for task in resp.get("succeeded") or []]
+        failed = {
+            task["id"]: (task.get("error") or {}).get("msg", "")
+            for task in resp.get("failed") or []
+        }
+        return succeeded, failed
+
+    # The bulk operations take at most BULK_CHUNK_SIZE task ids, and return the result of
+    # __send_many_request
+    def stop_tasks(self, task_ids):
+        return self.__send_many_request("tasks.stop_many", task_ids)
+
+    def dequeue_tasks(self, task_ids):
+        return self.__send_many_request("tasks.dequeue_many", task_ids)
+
+    def reset_tasks(self, task_ids):
+        return self.__send_many_request("tasks.reset_many", task_ids)
+
+    def enqueue_tasks(self, task_ids, queue_id):
+        return self.__send_many_request("tasks.enqueue_many", task_ids, queue=queue_id)
+
+    def archive_tasks(self, task_ids):
+        return self.__send_many_request("tasks.archive_many", task_ids)
+
+
+# Convert a date of the server, in ISO 8601 and UTC unless specified, to a timestamp
+def to_timestamp(value):
+    from datetime import datetime, timezone
+
+    date = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
@@ -1,15 +1,46 @@
-from clearml import Task
-from clearml.backend_interface.task.populate import CreateAndPopulate
-from clenv.cli.queue.queue_manager import QueueManager
-from git import Repo
-from InquirerPy import prompt
-from InquirerPy.validator import PathValidator, EmptyInputValidator
 from collections import OrderedDict
 
 import click
-import os, json
+import os, json, hashlib, threading
+
+TEMPLATE_FILE_PATH = "./.clenv/task_template.json"
+# The selected queue of a run config whose queue is selected at each execution
+AUTO_QUEUE = "auto"
+NO_AUTO_QUEUE_MESSAGE = "No queue with workers to select as the auto queue"
+# The exit status of `task logs --follow` for the final statuses of a task
+TASK_EXIT_CODES = {
+    "completed": 0,
+    "published": 0,
+    "closed": 0,
+    "failed": 1,
+    "stopped": 2,
+}
+# The statuses of the tasks shown by `task top`, and the fields fetched for them
+ACTIVE_TASK_STATUSES = ["in_progress", "queued"]
+TOP_TASK_FIELDS = [
+    "id",
+    "name",
+    "status",
+    "status_changed",
+    "started",
+    "last_update",
+    "last_iteration",
+    "execution.queue",
+]
+# The git info read by read_git_info, by directory
+GIT_INFO_CACHE = {}
+# The requirements got by get_task_requirements, by directory and script, and the lock
+# the threads of a batch share them with
+TASK_REQUIREMENTS_CACHE = {}
+TASK_REQUIREMENTS_LOCK = threading.Lock()
+# The attempts of exec to send a submission, before it's left to the background flush
+SUBMIT_ATTEMPTS = 3
+# How long the background flush retries the failed submissions
+SPOOL_RETRY_FOR_SEC = 3600
 
 # Write a subcommand about the task management
+# The ClearML SDK and InquirerPy are heavy to import, so they are imported
+# inside the commands that need them instead of at module level
 
 
 @click.group(help="Task management")
@@ -34,12 +65,55 @@ def task():
     show_default=True,
     is_flag=True,
 )
-def exec(new):
+@click.option(
+    "--batch",
+    "batch_file",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Submit the tasks of a JSON or YAML list of run configs without prompting, "
+    + "and print a JSON line per task",
+)
+@click.option(
+    "--concurrency",
+    default=8,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of tasks submitted concurrently in batch mode",
+)
+@click.option(
+    "--queue",
+    "-q",
+    "queue_name",
+    help="Queue to execute the task on, instead of the queue of the run config. With "
+    + f"`{AUTO_QUEUE}`, the queue with the shortest expected wait among the queues with "
+    + "workers is selected",
+)
+@click.option(
+    "--queue-group",
+    help="Comma separated queues, the one with the shortest expected wait is selected",
+)
+@click.option(
+    "--detach",
+    "-d",
+    is_flag=True,
+    help="Only spool the submission and send it in the background, see `task spool`",
+)
+def exec(new, batch_file, concurrency, queue_name, queue_group, detach):
     # Give user an interactive prompt to select queue to execute the task from the available queues
     # Solution
+    from clenv.cli.queue.queue_manager import QueueManager
+    from InquirerPy import prompt
+    from InquirerPy.validator import PathValidator, EmptyInputValidator
 
     queue_manager = QueueManager()
 
+    if batch_file is not None:
+        failures = execute_batch(
+            load_batch_file(batch_file), queue_manager, concurrency
+        )
+        if failures:
+            click.get_current_context().exit(1)
+        return
+
     available_queues = queue_manager.get_available_queues()
 
     if len(available_queues) == 0:
@@ -53,20 +127,19 @@ def exec(new):
     # Solution
     selected_queue_name = None
     run_config = None
-    if os.path.exists("./.clenv/task_template.json") and not new:
+    save_base_task = False
+    if os.path.exists(TEMPLATE_FILE_PATH) and not new:
         # If there is an existing template, load the template and use it to create a task
         # Solution
 
-        with open("./.clenv/task_template.json", "r") as f:
+        with open(TEMPLATE_FILE_PATH, "r") as f:
             run_config = json.load(f)
+        save_base_task = True
+        apply_queue_options(run_config, queue_name, queue_group)
         # selected_queue_name = run_config["selected_queue"].split("\n")[0]
-        # Check if selected_queue is in available_queues by filtering available_queues with name equals to selected_queue
-        # Don't use queue manager, filter directly on available_queues
-        selected_queue = [
-            queue
-            for queue in available_queues
-            if queue["name"] == run_config["selected_queue"]
-        ][0]
+        # Check if selected_queue is available, the queue manager looks it up in the queues
+        # it already fetched
+        selected_queue = resolve_queue(queue_manager, run_config)
 
         if selected_queue:
             # Check if the selected queue has idle workers
@@ -93,8 +166,18 @@ def exec(new):
             click.echo("Task execution cancelled")
             return
     else:
+        from clenv.cli.queue.latency_history import format_wait_stats
+
+        # The time to start is only shown in the queue picker, and is best effort, e.g.
+        # a locked history database shows no history rather than failing exec
+        wait_stats = {}
+        if queue_name is None and queue_group is None:
+            try:
+                wait_stats = queue_manager.get_wait_stats()
+            except Exception as e:
+                click.echo(f"Reading the queue wait history failed: {e}", err=True)
         queue_names = [
-            f"{queue['name']}\n - idle workers: {[worker['name'] for worker in queue['workers'] if worker['task'] is None]}\n - total workers: {len(queue['workers'])}"
+            f"{queue['name']}\n - idle workers: {[worker['name'] for worker in queue['workers'] if worker['task'] is None]}\n - total workers: {len(queue['workers'])}\n - time to start: {format_wait_stats(wait_stats.get(queue['id']))}"
             for queue in available_queues
         ]
 
@@ -105,6 +188,11 @@ def exec(new):
                 "choices": queue_names,
                 "name": "selected_queue",
             },
+        ]
+        # The queue is selected at each execution instead
+        if queue_name is not None or queue_group is not None:
+            questions = []
+        questions += [
             {
                 "type": "list",
                 "message": "Please choose a task type",
@@ -145,6 +233,7 @@ def exec(new):
 
         asnwers = prompt(questions)
         run_config = make_config(asnwers)
+        apply_queue_options(run_config, queue_name, queue_group)
 
         if asnwers["save_as_template"]:
             # Save the template to the current directory
@@ -152,18 +241,843 @@ def exec(new):
             # Then create a file named task_template.json in the .clenv directory
             # Then save the answers to the task_template.json file
             # Solution
+            save_template(run_config)
+            save_base_task = True
+
+        selected_queue = resolve_queue(queue_manager, run_config)
+        if selected_queue is None:
+            click.echo("Selected queue is not available", err=True)
+            return
+
+    # The run config is executed on the resolved queue, the template keeps the run config
+    # as it is, e.g. with the auto queue
+    execute_task(
+        dict(run_config, selected_queue=selected_queue["name"]),
+        queue_id=selected_queue["id"],
+        save_base_task=save_base_task,
+        queue_manager=queue_manager,
+        detach=detach,
+    )
+
+
+def save_template(run_config):
+    os.makedirs(os.path.dirname(TEMPLATE_FILE_PATH), exist_ok=True)
+    with open(TEMPLATE_FILE_PATH, "w") as f:
+        json.dump(run_config, f, indent=4)
+
+
+# Apply the --queue and --queue-group options of exec to the run config
+def apply_queue_options(run_config, queue_name=None, queue_group=None):
+    if queue_group is not None:
+        run_config["selected_queue"] = AUTO_QUEUE
+        run_config["queue_group"] = [
+            name.strip() for name in queue_group.split(",") if name.strip()
+        ]
+    elif queue_name is not None:
+        run_config["selected_queue"] = queue_name
+        run_config.pop("queue_group", None)
+
+
+# Get the queue to execute the run config on. The auto queue is resolved to the queue with
+# the shortest expected wait, among the queue group of the run config or the queues with
+# workers, and the score breakdown is displayed, on stderr if err is set. Return None if
+# the queue doesn't exist, or no queue can be selected.
+def resolve_queue(queue_manager, run_config, err=False):
+    if run_config["selected_queue"] != AUTO_QUEUE:
+        return queue_manager.get_queue(run_config["selected_queue"])
+
+    try:
+        queue, scores = queue_manager.select_queue(run_config.get("queue_group"))
+    except Exception as e:
+        raise click.ClickException(str(e))
+    for score in scores:
+        if score["expected_wait_sec"] is None:
+            expected_wait = "never, no workers"
+        else:
+            expected_wait = f"{score['expected_wait_sec']}s"
+        click.echo(
+            f"{score['queue']}: {score['idle_workers']}/{score['workers']} idle workers, "
+            + f"{score['pending']} pending, {score['throughput_per_min']} tasks/min "
+            + f"({score['throughput_source']}), expected wait {expected_wait}"
+            + (" <- selected" if queue and queue["id"] == score["queue_id"] else ""),
+            err=err,
+        )
+    return queue
+
+
+@task.command(
+    help="Run a hyperparameter sweep of the saved run config. \n\nThe script is populated "
+    + "once, or the base task of the ./.clenv/task_template.json template is reused, then "
+    + "every combination of the parameter values is submitted as a clone of it with the "
+    + "hyperparameters overridden. The clones are spread over the selected queues. \n\n"
+    + "Example: clenv task sweep --param lr=1e-3,1e-4 --param bs=32,64"
+)
+@click.option(
+    "--param",
+    "-p",
+    "params",
+    multiple=True,
+    required=True,
+    help="A parameter and its values, as NAME=VALUE1,VALUE2,... NAME is either "
+    + "<section>/<name>, or a name in the Args section",
+)
+@click.option(
+    "--queue",
+    "-q",
+    "queue_names",
+    multiple=True,
+    help="Queue to submit the tasks to, can be repeated to spread the tasks over "
+    + "several queues. Defaults to the queue of the saved run config",
+)
+@click.option(
+    "--random",
+    "random_samples",
+    type=click.IntRange(min=1),
+    help="Submit this many combinations sampled at random instead of the full grid",
+)
+@click.option("--seed", type=int, help="Seed of the random sampling")
+@click.option(
+    "--concurrency",
+    default=8,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of tasks submitted concurrently",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Print the expanded plan and the estimated submission time without submitting",
+)
+def sweep(params, queue_names, random_samples, seed, concurrency, dry_run):
+    from clenv.cli.queue.queue_manager import QueueManager
+    from clenv.cli.task.task_manager import TaskManager
+    import math
+    import time
+
+    if not os.path.exists(TEMPLATE_FILE_PATH):
+        raise click.ClickException(
+            "No saved run config, please run `clenv task exec` and save the run config "
+            + "as a template first"
+        )
+    with open(TEMPLATE_FILE_PATH, "r") as f:
+        run_config = json.load(f)
+    combinations = expand_sweep_params(parse_sweep_params(params), random_samples, seed)
+    queue_names = queue_names or [run_config["selected_queue"]]
+
+    queue_manager = QueueManager()
+    # Fetching the queues is also the measure of the server's round trip time
+    start = time.monotonic()
+    # The auto queue of a template is selected once, among its queue group
+    queues = [
+        resolve_queue(
+            queue_manager, dict(run_config, selected_queue=queue_name), err=True
+        )
+        for queue_name in queue_names
+    ]
+    round_trip_sec = time.monotonic() - start
+    missing_queue_names = [
+        queue_name for queue_name, queue in zip(queue_names, queues) if queue is None
+    ]
+    if AUTO_QUEUE in missing_queue_names:
+        raise click.ClickException(NO_AUTO_QUEUE_MESSAGE)
+    if missing_queue_names:
+        raise click.ClickException(f"Queues {missing_queue_names} do not exist")
+
+    git_info = read_git_info()
+    check_commit_pushed(git_info)
+    base_task_id = None
+    if run_config.get("base_task_fingerprint") == get_base_task_fingerprint(
+        run_config, git_info
+    ):
+        base_task_id = run_config.get("base_task_id")
+
+    plan = [
+        {
+            "task_name": " ".join(
+                [run_config["task_name"]]
+                + [f"{key.split('/')[-1]}={value}" for key, value in overrides.items()]
+            ),
+            "queue": queues[index % len(queues)]["name"],
+            "queue_id": queues[index % len(queues)]["id"],
+            "overrides": overrides,
+        }
+        for index, overrides in enumerate(combinations)
+    ]
+
+    if dry_run:
+        for item in plan:
+            click.echo(json.dumps({k: v for k, v in item.items() if k != "queue_id"}))
+        # Every task is a clone and an enqueue request, `concurrency` tasks at a time
+        estimate_sec = math.ceil(len(plan) / concurrency) * 2 * round_trip_sec
+        click.echo(
+            f"{len(plan)} tasks on {len(queues)} queue(s), estimated submission time: "
+            + f"{estimate_sec:.1f}s"
+            + ("" if base_task_id else ", plus populating the script once"),
+            err=True,
+        )
+        return
+
+    # The parent of the sweep's tasks is a clone of the template's base task updated to the
+    # current commit, or, without base task, a task populated from the script
+    init_sdk_session()
+    parent = None
+    if base_task_id:
+        from clearml import Task
+
+        try:
+            parent = Task.clone(
+                source_task=base_task_id, name=f"{run_config['task_name']} sweep"
+            )
+            parent.set_script(
+                branch=git_info["branch"], commit=git_info["commit"] or ""
+            )
+        except Exception as e:
+            # e.g. the base task was deleted from the server
+            click.echo(f"Cloning base task failed: {e}", err=True)
+    if parent is None:
+        click.echo("Populating the script", err=True)
+        parent = populate_task(
+            dict(run_config, task_name=f"{run_config['task_name']} sweep"),
+            git_info,
+            verbose=False,
+        )
+    task_manager = TaskManager()
+    hyperparams = task_manager.get_hyperparams(parent.id)
+
+    def submit(index, item):
+        report = {
+            "index": index,
+            "task_name": item["task_name"],
+            "queue": item["queue"],
+        }
+        start = time.monotonic()
+        try:
+            task_id = task_manager.clone_task(
+                parent.id, item["task_name"], hyperparams, item["overrides"]
+            )
+            task_manager.enqueue_task(task_id, item["queue_id"])
+            queue_manager.record_enqueue(task_id, item["queue_id"])
+            report.update(status="ok", task_id=task_id)
+        except Exception as e:
+            report.update(status="error", error=str(e))
+        report["latency_sec"] = round(time.monotonic() - start, 3)
+        return report
+
+    if submit_concurrently(submit, plan, concurrency):
+        click.get_current_context().exit(1)
+
+
+@task.command(
+    help="Print the console output of tasks. \n\nWith --follow, the new output is printed "
+    + "as it's reported, until all the tasks end. The exit status is then 0 if all the "
+    + "tasks completed, 1 if any task failed and 2 if any task was stopped."
+)
+@click.argument("task_ids", nargs=-1, required=True)
+@click.option(
+    "--follow",
+    "-f",
+    is_flag=True,
+    help="Keep printing the new output until the tasks end",
+)
+@click.option(
+    "--max-interval",
+    default=30.0,
+    show_default=True,
+    type=click.FloatRange(min=1),
+    help="Longest time between two polls of the server, in seconds, reached while the "
+    + "tasks don't report anything",
+)
+def logs(task_ids, follow, max_interval):
+    from clenv.cli.task.task_manager import TaskManager
+    import time
+
+    task_manager = TaskManager()
+    task_ids = list(OrderedDict.fromkeys(task_ids))
+    missing_task_ids = set(task_ids) - set(task_manager.get_task_statuses(task_ids))
+    if missing_task_ids:
+        raise click.ClickException(f"Tasks {sorted(missing_task_ids)} do not exist")
+
+    # The timestamp of the last event printed per task, only the events after it are
+    # fetched
+    cursors = {task_id: None for task_id in task_ids}
+
+    def print_new_events(task_id):
+        count = 0
+        while True:
+            events = task_manager.get_task_log(task_id, cursors[task_id])
+            for event in events:
+                for line in event.get("msg", "").rstrip("\n").split("\n"):
+                    # The lines are prefixed with the task when following several tasks
+                    click.echo(f"[{task_id}] {line}" if len(task_ids) > 1 else line)
+            if events:
+                cursors[task_id] = events[-1]["timestamp"]
+            count += len(events)
+            if len(events) < task_manager.LOG_BATCH_SIZE:
+                return count
+
+    if not follow:
+        for task_id in task_ids:
+            print_new_events(task_id)
+        return
+
+    following = task_ids
+    exit_codes = []
+    interval = 1
+    while following:
+        # The statuses are fetched before the events, so that the last events of a task
+        # that ended are printed before it's dropped
+        statuses = task_manager.get_task_statuses(following)
+        new_events = sum(print_new_events(task_id) for task_id in following)
+        for task_id in following:
+            status = statuses.get(task_id, "deleted")
+            if status in TASK_EXIT_CODES or status == "deleted":
+                click.echo(f"Task {task_id} {status}", err=True)
+                exit_codes.append(TASK_EXIT_CODES.get(status, 1))
+        following = [
+            task_id
+            for task_id in following
+            if statuses.get(task_id) not in TASK_EXIT_CODES and task_id in statuses
+        ]
+        if following:
+            # Poll every second while the tasks report, and back off while they don't
+            interval = 1 if new_events else min(interval * 2, max_interval)
+            time.sleep(interval)
+
+    click.get_current_context().exit(max(exit_codes))
+
+
+@task.command(
+    help="Show the running and queued tasks of the project of the current git repo, "
+    + "refreshed every few seconds. \n\nOnly the tasks updated since the previous refresh "
+    + "are fetched from the server."
+)
+@click.option(
+    "--interval",
+    default=2.0,
+    show_default=True,
+    type=click.FloatRange(min=0.5),
+    help="Seconds between two refreshes",
+)
+@click.option(
+    "--max-rows",
+    default=200,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum number of tasks kept, the least recently updated ones are dropped",
+)
+@click.option("--all-users", is_flag=True, help="Show the tasks of all the users")
+@click.option("--once", is_flag=True, help="Print the tasks once and exit")
+def top(interval, max_rows, all_users, once):
+    from clenv.cli.task.task_manager import TaskManager, to_timestamp
+    import itertools
+    import shutil
+    import time
+
+    task_manager = TaskManager()
+    project_name = read_git_info()["project_name"]
+    filters = {
+        "project": [get_project_id(task_manager, project_name)],
+        "order_by": ["-last_update"],
+    }
+    if not all_users:
+        filters["user"] = [task_manager.get_current_user_id()]
+
+    # The active tasks by id, the most recently updated last
+    tasks = OrderedDict()
+    # The last update of the most recently updated task, the next refresh only fetches the
+    # tasks updated since then. The server's dates are used, local clock skew is no issue.
+    cursor = None
+    queue_names = {}
+    project_refreshed = False
+    try:
+        while True:
+            if cursor is None:
+                updates = list(
+                    itertools.islice(
+                        task_manager.iter_tasks(
+                            TOP_TASK_FIELDS, status=ACTIVE_TASK_STATUSES, **filters
+                        ),
+                        max_rows,
+                    )
+                )
+                # The cached project id may be the one of a deleted project
+                if not updates and not project_refreshed:
+                    project_refreshed = True
+                    project_id = get_project_id(
+                        task_manager, project_name, refresh=True
+                    )
+                    if [project_id] != filters["project"]:
+                        filters["project"] = [project_id]
+                        continue
+            else:
+                updates = list(
+                    task_manager.iter_tasks(
+                        TOP_TASK_FIELDS, last_update=[f">={cursor}"], **filters
+                    )
+                )
+            for task in reversed(updates):
+                if cursor is None or to_timestamp(task["last_update"]) > to_timestamp(
+                    cursor
+                ):
+                    cursor = task["last_update"]
+                tasks.pop(task["id"], None)
+                if task["status"] in ACTIVE_TASK_STATUSES:
+                    tasks[task["id"]] = task
+                    if len(tasks) > max_rows:
+                        tasks.popitem(last=False)
+
+            lines = format_top_lines(project_name, tasks, queue_names)
+            if once:
+                click.echo("\n".join(lines))
+                return
+            click.clear()
+            click.echo("\n".join(lines[: shutil.get_terminal_size().lines - 1]))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+# Get the id of a project, cached by the task manager, or fail if it doesn't exist
+def get_project_id(task_manager, project_name, refresh=False):
+    project_id = task_manager.get_project_id(project_name, refresh=refresh)
+    if project_id is None:
+        raise click.ClickException(f"Project {project_name} does not exist")
+    return project_id
+
+
+# Format the header and the table of `task top`, the running tasks first, then the most
+# recently updated. The queue names are looked up once and kept in queue_names.
+def format_top_lines(project_name, tasks, queue_names):
+    from clenv.cli.queue.latency_history import format_duration
+    from clenv.cli.task.task_manager import to_timestamp
+    import time
+
+    queue_ids = {
+        (task.get("execution") or {}).get("queue") for task in tasks.values()
+    } - {None}
+    if queue_ids - set(queue_names):
+        from clenv.cli.queue.queue_manager import QueueManager
+
+        queue_manager = QueueManager()
+        for queue_id in queue_ids - set(queue_names):
+            queue = queue_manager.get_queue(queue_id=queue_id)
+            queue_names[queue_id] = queue["name"] if queue else queue_id
+
+    now = time.time()
+    rows = []
+    for task in sorted(
+        reversed(tasks.values()),
+        key=lambda task: ACTIVE_TASK_STATUSES.index(task["status"]),
+    ):
+        # The time the task has been running, or waiting in the queue
+        since = task.get("started") if task["status"] == "in_progress" else None
+        since = since or task.get("status_changed")
+        queue_id = (task.get("execution") or {}).get("queue")
+        rows.append(
+            [
+                task["id"],
+                task["status"],
+                queue_names.get(queue_id, "") if queue_id else "",
+                str(task.get("last_iteration") or 0),
+                format_duration(now - to_timestamp(since)) if since else "",
+                task.get("name", ""),
+            ]
+        )
+
+    running = len([task for task in tasks.values() if task["status"] == "in_progress"])
+    lines = [
+        f"{project_name}: {running} running, {len(tasks) - running} queued "
+        + f"(refreshed at {time.strftime('%H:%M:%S')})",
+    ]
+    headers = ["ID", "STATUS", "QUEUE", "ITER", "TIME", "NAME"]
+    widths = [max(len(row[i]) for row in rows + [headers]) for i in range(len(headers))]
+    for row in [headers] + rows:
+        lines.append("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+    return lines
+
+
+# The options shared by the bulk task operations
+def bulk_task_options(command):
+    for option in reversed(
+        [
+            click.option(
+                "--filter",
+                "-f",
+                "filters",
+                multiple=True,
+                help="Filter of the tasks, as KEY=VALUE, where KEY is status, name (a "
+                + "regex), tag, user (an id, or me), id or project. Values can be comma "
+                + "separated. Can be repeated. The tasks are in the project of the current "
+                + "git repo unless a project is given",
+            ),
+            click.option(
+                "--concurrency",
+                default=4,
+                show_default=True,
+                type=click.IntRange(min=1),
+                help="Number of requests sent concurrently",
+            ),
+            click.option(
+                "--dry-run", is_flag=True, help="Print the matching tasks and exit"
+            ),
+            click.option(
+                "--yes", "-y", is_flag=True, help="Do not ask for confirmation"
+            ),
+        ]
+    ):
+        command = option(command)
+    return command
+
+
+@task.command(help="Stop the running tasks matching the filters")
+@bulk_task_options
+def stop(filters, concurrency, dry_run, yes):
+    from clenv.cli.task.task_manager import TaskManager
+
+    task_manager = TaskManager()
+    task_ids = find_bulk_tasks(
+        task_manager, filters, ["in_progress"], "Stop", dry_run, yes
+    )
+    if run_bulk_operation("stopped", task_manager.stop_tasks, task_ids, concurrency):
+        click.get_current_context().exit(1)
+
+
+@task.command(help="Dequeue the queued tasks matching the filters")
+@bulk_task_options
+def dequeue(filters, concurrency, dry_run, yes):
+    from clenv.cli.task.task_manager import TaskManager
+
+    task_manager = TaskManager()
+    task_ids = find_bulk_tasks(
+        task_manager, filters, ["queued"], "Dequeue", dry_run, yes
+    )
+    if run_bulk_operation(
+        "dequeued", task_manager.dequeue_tasks, task_ids, concurrency
+    ):
+        click.get_current_context().exit(1)
+
+
+@task.command(
+    help="Reset the stopped and failed tasks matching the filters, and enqueue them "
+    + "again, in the queue they were last enqueued to unless a queue is given"
+)
+@bulk_task_options
+@click.option("--queue", "-q", "queue_name", help="Queue to enqueue the tasks to")
+def requeue(filters, concurrency, dry_run, yes, queue_name):
+    from clenv.cli.queue.queue_manager import QueueManager
+    from clenv.cli.task.task_manager import TaskManager
 
-            os.makedirs(".clenv", exist_ok=True)
-            with open(".clenv/task_template.json", "w") as f:
-                json.dump(run_config, f, indent=4)
+    task_manager = TaskManager()
+    tasks = find_bulk_tasks(
+        task_manager,
+        filters,
+        ["stopped", "failed"],
+        "Requeue",
+        dry_run,
+        yes,
+        fields=["id", "execution.queue"],
+    )
+
+    queue_id = None
+    if queue_name is not None:
+        queue = QueueManager().get_queue(queue_name)
+        if queue is None:
+            raise click.ClickException(f"Queue {queue_name} does not exist")
+        queue_id = queue["id"]
+    # A task can only be enqueued in draft status, so it's reset first. The tasks are
+    # enqueued per queue, a *_many request takes a single queue.
+    queue_ids = {
+        task["id"]: queue_id or (task.get("execution") or {}).get("queue")
+        for task in tasks
+    }
+
+    def requeue_tasks(task_ids):
+        succeeded, failed = task_manager.reset_tasks(task_ids)
+        failed.update(
+            {task_id: "No queue" for task_id in succeeded if not queue_ids[task_id]}
+        )
+        tasks_by_queue = {}
+        for task_id in succeeded:
+            if queue_ids[task_id]:
+                tasks_by_queue.setdefault(queue_ids[task_id], []).append(task_id)
+        succeeded = []
+        for task_queue_id, queue_task_ids in tasks_by_queue.items():
+            queue_succeeded, queue_failed = task_manager.enqueue_tasks(
+                queue_task_ids, task_queue_id
+            )
+            succeeded += queue_succeeded
+            failed.update(queue_failed)
+        return succeeded, failed
+
+    task_ids = [task["id"] for task in tasks]
+    if run_bulk_operation("requeued", requeue_tasks, task_ids, concurrency):
+        click.get_current_context().exit(1)
+
+
+@task.command(help="Archive the tasks matching the filters")
+@bulk_task_options
+def archive(filters, concurrency, dry_run, yes):
+    from clenv.cli.task.task_manager import TaskManager
+
+    task_manager = TaskManager()
+    task_ids = find_bulk_tasks(
+        task_manager,
+        filters,
+        ["created", "completed", "stopped", "failed", "published"],
+        "Archive",
+        dry_run,
+        yes,
+    )
+    if run_bulk_operation(
+        "archived", task_manager.archive_tasks, task_ids, concurrency
+    ):
+        click.get_current_context().exit(1)
+
+
+@task.group(
+    help="Inspect and send the submissions of exec kept in the ./.clenv/spool "
+    + "directory. A submission is spooled before it's sent to the server, and stays "
+    + "there until it's sent."
+)
+def spool():
+    pass
+
+
+@spool.command(
+    help="Send the spooled submissions to the server, and print a JSON line per "
+    + "submission. The failed submissions stay in the spool."
+)
+@click.option(
+    "--concurrency",
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of submissions sent concurrently",
+)
+@click.option(
+    "--retry-for",
+    default=0,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Seconds during which the failed submissions are retried, with backoff",
+)
+def flush(concurrency, retry_for):
+    from clenv.cli.queue.queue_manager import QueueManager
+    from clenv.cli.task.submission_spool import SubmissionSpool
+    import time
+
+    submission_spool = SubmissionSpool()
+    queue_manager = QueueManager()
 
-    execute_task(run_config)
+    def submit(index, entry):
+        run_config = entry["run_config"]
+        report = {
+            "index": index,
+            "spool_id": entry["id"],
+            "task_name": run_config["task_name"],
+            "queue": run_config["selected_queue"],
+        }
+        start = time.monotonic()
+        try:
+            task_id, _ = submit_spool_entry(
+                entry, submission_spool, queue_manager, verbose=False
+            )
+            submission_spool.remove(entry)
+            report.update(status="ok", task_id=task_id)
+        except Exception as e:
+            submission_spool.release(entry, str(e))
+            report.update(status="error", error=str(e))
+        report["latency_sec"] = round(time.monotonic() - start, 3)
+        return report
+
+    deadline = time.monotonic() + retry_for
+    delay = 1
+    while True:
+        # The entries claimed by another flush are left to it
+        entries = [
+            submission_spool.claim(entry["id"])
+            for entry in submission_spool.get_entries()
+            if entry["state"] == "pending"
+        ]
+        entries = [entry for entry in entries if entry is not None]
+        failures = submit_concurrently(submit, entries, concurrency)
+        if not failures or time.monotonic() + delay > deadline:
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, 60)
+    if failures:
+        click.get_current_context().exit(1)
+
+
+@spool.command(help="Show the spooled submissions")
+def status():
+    from clenv.cli.queue.latency_history import format_duration
+    from clenv.cli.task.submission_spool import SubmissionSpool
+    import time
+
+    entries = SubmissionSpool().get_entries()
+    if not entries:
+        click.echo("No spooled submissions")
+        return
+    now = time.time()
+    headers = ["ID", "STATE", "AGE", "ATTEMPTS", "QUEUE", "NAME", "LAST ERROR"]
+    rows = [
+        [
+            entry["id"],
+            entry["state"],
+            format_duration(now - entry["created_at"]),
+            str(entry["attempts"]),
+            entry["run_config"]["selected_queue"],
+            entry["run_config"]["task_name"],
+            (entry.get("last_error") or "").split("\n")[0],
+        ]
+        for entry in entries
+    ]
+    widths = [max(len(row[i]) for row in rows + [headers]) for i in range(len(headers))]
+    for row in [headers] + rows:
+        click.echo("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+# Find the tasks matching the --filter options of a bulk operation, in the statuses of the
+# operation unless a status filter is given. Only the ids are fetched, or the given
+# fields, page by page. Print the tasks and exit in dry run, otherwise ask for confirmation
+# unless yes is set. Return the task ids, or the tasks if fields are given.
+def find_bulk_tasks(task_manager, filters, statuses, action, dry_run, yes, fields=None):
+    query = {"status": statuses}
+    project_name = None
+    for task_filter in filters:
+        key, sep, value = task_filter.partition("=")
+        if not sep or not value:
+            raise click.BadParameter(
+                f"{task_filter} is not in the KEY=VALUE format", param_hint="--filter"
+            )
+        values = value.split(",")
+        if key == "status":
+            query["status"] = values
+        elif key == "name":
+            query["name"] = value
+        elif key == "tag":
+            query["tags"] = values
+        elif key == "id":
+            query["id"] = values
+        elif key == "user":
+            query["user"] = [
+                task_manager.get_current_user_id() if user == "me" else user
+                for user in values
+            ]
+        elif key == "project":
+            project_name = value
+        else:
+            raise click.BadParameter(f"Unknown filter {key}", param_hint="--filter")
+    if project_name is None:
+        project_name = read_git_info()["project_name"]
+    query["project"] = [get_project_id(task_manager, project_name)]
+
+    tasks = list(task_manager.iter_tasks(fields or ["id"], **query))
+    # The cached project id may be the one of a deleted project
+    if not tasks:
+        project_id = get_project_id(task_manager, project_name, refresh=True)
+        if [project_id] != query["project"]:
+            query["project"] = [project_id]
+            tasks = list(task_manager.iter_tasks(fields or ["id"], **query))
+    if not tasks:
+        click.echo("No matching tasks", err=True)
+        click.get_current_context().exit(0)
+    if dry_run:
+        for task in tasks:
+            click.echo(task["id"])
+        click.get_current_context().exit(0)
+    if not yes:
+        click.confirm(
+            f"{action} {len(tasks)} tasks of project {project_name}?", abort=True
+        )
+    return tasks if fields else [task["id"] for task in tasks]
+
+
+# Apply a bulk operation to the tasks in chunks of BULK_CHUNK_SIZE ids, `concurrency`
+# chunks at a time. operation(task_ids) returns the ids of the tasks it succeeded for, and
+# a dict of task id to error for the ones it failed for. The progress is printed on
+# stderr, then a summary. Return the number of failed tasks.
+def run_bulk_operation(verb, operation, task_ids, concurrency):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from clenv.cli.task.task_manager import TaskManager
+
+    chunk_size = TaskManager.BULK_CHUNK_SIZE
+    chunks = [task_ids[i : i + chunk_size] for i in range(0, len(task_ids), chunk_size)]
+    done = 0
+    succeeded = 0
+    failed = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(operation, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                chunk_succeeded, chunk_failed = future.result()
+            except Exception as e:
+                chunk_succeeded, chunk_failed = [], {
+                    task_id: str(e) for task_id in chunk
+                }
+            succeeded += len(chunk_succeeded)
+            failed.update(chunk_failed)
+            done += len(chunk)
+            click.echo(f"{done}/{len(task_ids)} tasks processed", err=True)
+
+    click.echo(f"{succeeded} tasks {verb}, {len(failed)} failed")
+    for task_id, error in failed.items():
+        click.echo(f"{task_id}: {error}")
+    return len(failed)
+
+
+# Parse the --param options of a sweep into a dict of "<section>/<name>" to the list of
+# values of the parameter
+def parse_sweep_params(params):
+    sweep_params = {}
+    for param in params:
+        name, sep, values = param.partition("=")
+        if not sep or not name or not values:
+            raise click.BadParameter(
+                f"{param} is not in the NAME=VALUE1,VALUE2,... format",
+                param_hint="--param",
+            )
+        if "/" not in name:
+            name = f"Args/{name}"
+        sweep_params[name] = values.split(",")
+    return sweep_params
+
+
+# Expand the sweep parameters into the list of combinations to submit, each one a dict of
+# parameter to value. That's the full grid, or random_samples combinations of it sampled
+# without replacement.
+def expand_sweep_params(sweep_params, random_samples=None, seed=None):
+    import itertools
+    import random
+
+    names = list(sweep_params.keys())
+    value_lists = [sweep_params[name] for name in names]
+    grid_size = 1
+    for values in value_lists:
+        grid_size *= len(values)
+    if random_samples is None or random_samples >= grid_size:
+        return [dict(zip(names, values)) for values in itertools.product(*value_lists)]
+
+    # Decode the sampled grid indices rather than materializing the whole grid
+    combinations = []
+    for grid_index in random.Random(seed).sample(range(grid_size), random_samples):
+        combination = {}
+        for name, values in reversed(list(zip(names, value_lists))):
+            grid_index, value_index = divmod(grid_index, len(values))
+            combination[name] = values[value_index]
+        combinations.append({name: combination[name] for name in names})
+    return combinations
 
 
 # Display the task template using the task template json, the input is a json object
 def show_config(task_template):
     # Iterate through all the key value pairs in the task_template
     for key, value in task_template.items():
+        # The base task is bookkeeping of clenv, not a part of the run config
+        if key.startswith("base_task_"):
+            continue
         desc = key.replace("_", " ").capitalize()
         click.echo(f"{desc}: {value}")
 
@@ -179,32 +1093,145 @@ def make_config(raw_template):
     return run_config
 
 
-def execute_task(run_config):
-    repo = Repo(".")
-    # Check if the repo is in detached head state, if so, exit with error
-    if repo.head.reference is None:
+# Read the git information of the repo in the current directory, the task is created
+# from the branch, the commit and the origin remote of the repo. The information is read
+# once per process and directory, so that the submissions of a batch or a sweep share it.
+def read_git_info():
+    from clenv.cli.task.git_reader import GitReader
+
+    cwd = os.path.realpath(".")
+    if cwd in GIT_INFO_CACHE:
+        return GIT_INFO_CACHE[cwd]
+
+    git_reader = GitReader(".")
+    branch, commit = git_reader.get_head()
+    if branch is None:
         click.echo(
             message="The repo is in detached head state, please checkout a branch",
             err=True,
         )
+    remote_url = git_reader.get_remote_url("origin")
+    if remote_url is None:
+        raise click.ClickException("The repo has no origin remote")
 
-    # Read the git information from current directory
-    current_branch = repo.head.reference.name
-    remote_url = repo.remotes.origin.url
     project_name = remote_url.split("/")[-1].split(".")[0]
+    GIT_INFO_CACHE[cwd] = {
+        "branch": branch,
+        "commit": commit,
+        "remote_url": remote_url,
+        "project_name": project_name,
+    }
+    return GIT_INFO_CACHE[cwd]
+
+
+# Warn when the tasks created from the git info would fail to check out their commit
+def check_commit_pushed(git_info):
+    from clenv.cli.task.git_reader import GitReader
+
+    commit = git_info["commit"]
+    if commit is None:
+        click.echo("Warning: the current branch has no commit yet", err=True)
+    elif GitReader(".").is_pushed(commit, "origin") is False:
+        click.echo(
+            f"Warning: commit {commit[:8]} is not pushed to origin, "
+            + "the task will fail to check it out",
+            err=True,
+        )
+
+
+# Get the requirements of a task to populate, as the arguments of CreateAndPopulate. The
+# requirements.txt of the repo is used as is. Without it, the requirements are detected
+# from the imports of the script, and the detection is cached by the content of the repo.
+# The requirements are got once per process, directory and script, so that the
+# submissions of a batch don't hash the repo or detect the requirements again.
+def get_task_requirements(run_config, verbose=True):
+    cache_key = (os.path.realpath("."), run_config["script_path"])
+    with TASK_REQUIREMENTS_LOCK:
+        if cache_key not in TASK_REQUIREMENTS_CACHE:
+            TASK_REQUIREMENTS_CACHE[cache_key] = read_task_requirements(
+                run_config, verbose
+            )
+        return dict(TASK_REQUIREMENTS_CACHE[cache_key])
+
+
+# Get the requirements of a task to populate, see get_task_requirements, with the content
+# of requirements.txt read. They are stored with a spooled submission, which is then sent
+# as it was submitted, even if the working tree changed in the meantime.
+def get_resolved_task_requirements(run_config):
+    requirements = get_task_requirements(run_config)
+    if "requirements_file" in requirements:
+        with open(requirements["requirements_file"], "r") as f:
+            return {"packages": [line.strip() for line in f]}
+    return requirements
+
+
+def read_task_requirements(run_config, verbose):
+    from clenv.cli.task.requirements_cache import (
+        RequirementsCache,
+        detect_requirements,
+    )
 
+    if os.path.isfile("requirements.txt"):
+        return {"requirements_file": "requirements.txt"}
+
+    cache = RequirementsCache()
+    key = cache.get_key(run_config["script_path"])
+    packages = cache.get(key)
+    if packages is not None:
+        if verbose:
+            click.echo("Requirements cache hit, the requirements detection is skipped")
+    else:
+        if verbose:
+            click.echo(
+                f"Requirements cache miss, detecting the requirements of {run_config['script_path']}"
+            )
+        packages = detect_requirements(".", run_config["script_path"])
+        # An empty detection is most likely a failed one, it's not cached
+        if packages:
+            cache.put(key, packages)
+    return {"packages": packages or None}
+
+
+# Make the ClearML SDK calls of the command use the in-process shared session, with its
+# cached token, also when the daemon is enabled
+def init_sdk_session():
+    from clenv.cli.config.config_loader import ConfigLoader
+    from clenv.cli import api_client
+
+    api_client.init_sdk_session(ConfigLoader())
+
+
+# Create a task from the run config and the git info, with the given requirements, as
+# returned by get_task_requirements, or the requirements detected from the script, or
+# cached. on_created, if given, is called with the id of the task as soon as it's created
+# on the server, before it's populated. Return the created task, in draft status.
+def populate_task(
+    run_config, git_info, verbose=True, requirements=None, on_created=None
+):
+    from clearml.backend_interface.task.populate import CreateAndPopulate
+
+    # CreateAndPopulate sets the output URI of the task right after creating it, and
+    # only then populates it
+    class NotifyingCreateAndPopulate(CreateAndPopulate):
+        def _set_output_uri(self, task):
+            if on_created is not None:
+                on_created(task.id)
+            super()._set_output_uri(task)
+
+    init_sdk_session()
+    if requirements is None:
+        requirements = get_task_requirements(run_config, verbose=verbose)
     # Create a task object
-    create_populate = CreateAndPopulate(
-        project_name=project_name,
+    create_populate = NotifyingCreateAndPopulate(
+        project_name=git_info["project_name"],
         task_name=run_config["task_name"],
         task_type=run_config["selected_task_type"],
-        repo=remote_url,
-        branch=current_branch,
-        # commit=args.commit,
+        repo=git_info["remote_url"],
+        branch=git_info["branch"],
+        commit=git_info["commit"],
         script=run_config["script_path"],
         # working_directory=args.cwd,
-        # packages=args.packages,
-        # requirements_file=args.requirements,
+        **requirements,
         # docker=args.docker,
         # docker_args=args.docker_args,
         # docker_bash_setup_script=bash_setup_script,
@@ -212,21 +1239,365 @@ def execute_task(run_config):
         # base_task_id=args.base_task_id,
         # add_task_init_call=not args.skip_task_init,
         # raise_on_missing_entries=True,
-        verbose=True,
+        verbose=verbose,
     )
     create_populate.create_task()
 
     create_populate.task._set_runtime_properties({"_CLEARML_TASK": True})
 
-    click.echo("New task created id={}".format(create_populate.get_id()))
+    if verbose:
+        click.echo("New task created id={}".format(create_populate.get_id()))
+    return create_populate.task
+
+
+# Clone the base task, a task previously populated from the same script, instead of
+# analysing the script and the repo again. Only the name is updated, then the branch and
+# the commit by update_cloned_task. Return the created task, in draft status.
+def clone_task(base_task_id, run_config):
+    from clearml import Task
+
+    init_sdk_session()
+    return Task.clone(source_task=base_task_id, name=run_config["task_name"])
+
+
+# Update a task cloned by clone_task to run on the branch and the commit of the git info
+def update_cloned_task(task, git_info):
+    task.set_script(branch=git_info["branch"], commit=git_info["commit"] or "")
+    task._set_runtime_properties({"_CLEARML_TASK": True})
+
+
+# The fingerprint of what a populated task depends on, other than the commit: the repo, the
+# entrypoint script, the task type and the requirements. The requirements are the content
+# of requirements.txt, or, without it, the requirements detected from the imports of the
+# script and of the local modules it uses.
+def get_base_task_fingerprint(run_config, git_info):
+    fingerprint = hashlib.sha256()
+    for value in (
+        git_info["remote_url"],
+        git_info["project_name"],
+        run_config["script_path"],
+        run_config["selected_task_type"],
+    ):
+        fingerprint.update(value.encode("utf-8") + b"\0")
+    requirements = get_task_requirements(run_config)
+    if "requirements_file" in requirements:
+        with open(requirements["requirements_file"], "rb") as f:
+            fingerprint.update(f.read())
+    else:
+        fingerprint.update("\n".join(requirements["packages"] or []).encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+# Spool the submission of the run config, then send it to the server, retrying with
+# backoff. A submission that still fails is left in the spool, and sent by a background
+# flush. With detach, the submission is only spooled and sent in the background. If
+# save_base_task is True, a fully populated task is recorded in the template as the base
+# task of the next executions. The enqueue is recorded in the latency history of the
+# queue manager, if any.
+def execute_task(
+    run_config, queue_id, save_base_task=False, queue_manager=None, detach=False
+):
+    from clenv.cli.task.submission_spool import SubmissionSpool
+    import time
+
+    git_info = read_git_info()
+    check_commit_pushed(git_info)
+    spool = SubmissionSpool()
+    entry_id = spool.add(
+        {
+            "run_config": run_config,
+            "git_info": git_info,
+            "queue_id": queue_id,
+            "fingerprint": get_base_task_fingerprint(run_config, git_info),
+            "requirements": get_resolved_task_requirements(run_config),
+            "save_base_task": save_base_task,
+        }
+    )
+    if detach:
+        start_spool_flush(spool)
+        click.echo(
+            f"Submission {entry_id} spooled, it's sent in the background, "
+            + "see `clenv task spool status`"
+        )
+        return
 
-    Task.enqueue(create_populate.task, queue_name=run_config["selected_queue"])
+    entry = spool.claim(entry_id)
+    if entry is None:
+        # A background flush of an earlier submission claimed the entry first
+        click.echo(
+            f"Submission {entry_id} is sent by the background flush, "
+            + "see `clenv task spool status`"
+        )
+        return
+    for attempt in range(SUBMIT_ATTEMPTS):
+        try:
+            task_id, log_url = submit_spool_entry(entry, spool, queue_manager)
+            break
+        except Exception as e:
+            error = str(e)
+            if attempt + 1 < SUBMIT_ATTEMPTS:
+                click.echo(f"Submission failed: {e}, retrying", err=True)
+                time.sleep(2**attempt)
+    else:
+        spool.release(entry, error)
+        start_spool_flush(spool)
+        raise click.ClickException(
+            f"Submission failed: {error}. It's kept in the spool and retried in the "
+            + "background, see `clenv task spool status`"
+        )
+    spool.remove(entry)
 
     click.echo(
         "Task id={} sent for execution on queue {}".format(
-            create_populate.get_id(), run_config["selected_queue"]
+            task_id, run_config["selected_queue"]
         )
     )
+    click.echo("Execution log at: {}".format(log_url))
     click.echo(
-        "Execution log at: {}".format(create_populate.task.get_output_log_web_page())
+        "Follow the console output with: clenv task logs --follow {}".format(task_id)
     )
+
+
+# Create the task of a claimed spool entry and enqueue it. The id of the task is written
+# to the entry as soon as the task exists on the server, as "created_task_id", then as
+# "task_id" once the task is complete, before it's enqueued. A retry of the entry deletes
+# the incomplete task of an interrupted creation before creating it again, and only
+# enqueues a complete task, if it's still a draft. Return the id and the output log page
+# of the task.
+def submit_spool_entry(entry, spool, queue_manager=None, verbose=True):
+    from clenv.cli.task.task_manager import TaskManager
+
+    def on_created(created_task_id):
+        entry["created_task_id"] = created_task_id
+        spool.update(entry)
+
+    task_manager = TaskManager()
+    task_id = entry.get("task_id")
+    if task_id is None:
+        created_task_id = entry.get("created_task_id")
+        if created_task_id is not None:
+            if created_task_id in task_manager.get_task_statuses([created_task_id]):
+                task_manager.delete_task(created_task_id)
+            del entry["created_task_id"]
+            spool.update(entry)
+        task_id, log_url = create_spool_entry_task(entry, verbose, on_created)
+        entry.update(task_id=task_id, log_url=log_url)
+        spool.update(entry)
+    else:
+        status = task_manager.get_task_statuses([task_id]).get(task_id)
+        if status is None:
+            raise Exception(f"Task {task_id} of the submission was deleted")
+        if status != "created":
+            # The enqueue succeeded, but its response was lost
+            return task_id, entry["log_url"]
+    task_manager.enqueue_task(task_id, entry["queue_id"])
+    if queue_manager is not None:
+        queue_manager.record_enqueue(task_id, entry["queue_id"])
+    return task_id, entry["log_url"]
+
+
+# Create the task of a spool entry, in draft status. When the run config records a base
+# task with the same fingerprint, the base task is cloned, otherwise the task is fully
+# populated. on_created is called with the id of the task as soon as it's created on the
+# server. Return the id and the output log page of the task.
+def create_spool_entry_task(entry, verbose, on_created):
+    run_config = entry["run_config"]
+    git_info = entry["git_info"]
+
+    base_task_id = run_config.get("base_task_id")
+    if base_task_id and run_config.get("base_task_fingerprint") == entry["fingerprint"]:
+        if verbose:
+            click.echo("Cloning base task id={}".format(base_task_id))
+        try:
+            return clone_base_task(base_task_id, run_config, git_info, on_created)
+        except Exception as e:
+            # A clone created but not updated is deleted by the retry of the entry
+            if entry.get("created_task_id") is not None:
+                raise
+            # e.g. the base task was deleted from the server
+            click.echo(f"Cloning base task failed: {e}", err=True)
+    task = populate_task(
+        run_config,
+        git_info,
+        verbose=verbose,
+        requirements=entry.get("requirements"),
+        on_created=on_created,
+    )
+    if entry["save_base_task"]:
+        record_base_task(task.id, entry["fingerprint"])
+    return task.id, task.get_output_log_web_page()
+
+
+# Start a process flushing the spool in the background, which keeps retrying the failed
+# submissions for a while. Its output is appended to the log file of the spool.
+def start_spool_flush(spool):
+    import subprocess
+    import sys
+
+    with open(spool.get_log_file_path(), "a") as log_file:
+        subprocess.Popen(
+            [sys.executable, "-m", "clenv.cli", "task", "spool", "flush"]
+            + ["--retry-for", str(SPOOL_RETRY_FOR_SEC)],
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+
+
+# Clone the base task and update the clone to the git info. With the daemon enabled,
+# that's done by the daemon, which has the ClearML SDK imported already. on_created is
+# called with the id of the clone before it's updated. Return the id and the output log
+# page of the new task.
+def clone_base_task(base_task_id, run_config, git_info, on_created):
+    from clenv.cli.config.config_loader import ConfigLoader
+    from clenv.cli.api_client import get_session, is_daemon_session
+
+    session = get_session(ConfigLoader())
+    if is_daemon_session(session):
+        result = session.clone_task(base_task_id, run_config)
+        on_created(result["id"])
+        session.update_cloned_task(result["id"], git_info)
+        return result["id"], result["log_url"]
+    task = clone_task(base_task_id, run_config)
+    on_created(task.id)
+    update_cloned_task(task, git_info)
+    return task.id, task.get_output_log_web_page()
+
+
+# Record the base task in the template, leaving the rest of the template as it is
+def record_base_task(task_id, fingerprint):
+    with open(TEMPLATE_FILE_PATH, "r") as f:
+        template = json.load(f)
+    template["base_task_id"] = task_id
+    template["base_task_fingerprint"] = fingerprint
+    save_template(template)
+
+
+# Load the run configs of a batch file, a JSON or YAML list of run configs with the same
+# keys as ./.clenv/task_template.json. selected_task_type defaults to training.
+def load_batch_file(batch_file_path):
+    with open(batch_file_path, "r") as f:
+        if batch_file_path.endswith((".yaml", ".yml")):
+            import yaml
+
+            run_configs = yaml.safe_load(f)
+        else:
+            run_configs = json.load(f)
+    if not isinstance(run_configs, list):
+        raise click.ClickException("The batch file must contain a list of run configs")
+    for index, run_config in enumerate(run_configs):
+        missing_keys = [
+            key
+            for key in ("selected_queue", "task_name", "script_path")
+            if key not in run_config
+        ]
+        if missing_keys:
+            raise click.ClickException(f"Run config #{index} misses {missing_keys}")
+        run_config.setdefault("selected_task_type", "training")
+    return run_configs
+
+
+# Submit all the run configs of a batch, through a pool of `concurrency` threads. All the
+# submissions share the API session of the queue manager and one read of the git info.
+# Like the sweep, a base task is populated once per script and task type, and left in
+# draft, and every run config of that script and task type is submitted as a clone of
+# it. A JSON line is printed per run config when its submission finishes. Return the
+# number of failed submissions.
+def execute_batch(run_configs, queue_manager, concurrency):
+    from clenv.cli.task.task_manager import TaskManager
+    import time
+
+    git_info = read_git_info()
+    check_commit_pushed(git_info)
+    # Before the threads, which would otherwise race to create the SDK default session
+    init_sdk_session()
+
+    # The auto queue is selected once per queue group, before the submissions. The error
+    # of a selection fails the run configs of its queue group only.
+    auto_queues = {}
+    for run_config in run_configs:
+        queue_group = tuple(run_config.get("queue_group") or ())
+        if run_config["selected_queue"] != AUTO_QUEUE or queue_group in auto_queues:
+            continue
+        try:
+            auto_queues[queue_group] = resolve_queue(
+                queue_manager, run_config, err=True
+            ) or Exception(NO_AUTO_QUEUE_MESSAGE)
+        except click.ClickException as e:
+            auto_queues[queue_group] = Exception(e.message)
+
+    # The base task of every script and task type. The first submission of a script and
+    # task type populates it under the lock, while the others wait to clone it.
+    task_manager = TaskManager()
+    base_task_ids = {}
+    base_task_locks = {
+        (run_config["script_path"], run_config["selected_task_type"]): threading.Lock()
+        for run_config in run_configs
+    }
+
+    def submit(index, run_config):
+        report = {
+            "index": index,
+            "task_name": run_config["task_name"],
+            "queue": run_config["selected_queue"],
+        }
+        start = time.monotonic()
+        try:
+            if run_config["selected_queue"] == AUTO_QUEUE:
+                queue = auto_queues[tuple(run_config.get("queue_group") or ())]
+                if isinstance(queue, Exception):
+                    raise queue
+                report["queue"] = queue["name"]
+            else:
+                queue = queue_manager.get_queue(run_config["selected_queue"])
+                if queue is None:
+                    raise Exception(
+                        f"Queue {run_config['selected_queue']} does not exist"
+                    )
+            base_task_key = (
+                run_config["script_path"],
+                run_config["selected_task_type"],
+            )
+            with base_task_locks[base_task_key]:
+                if base_task_key not in base_task_ids:
+                    base_task = populate_task(
+                        dict(
+                            run_config,
+                            task_name=f"{run_config['script_path']} batch base",
+                        ),
+                        git_info,
+                        verbose=False,
+                    )
+                    base_task_ids[base_task_key] = base_task.id
+            task_id = task_manager.clone_task(
+                base_task_ids[base_task_key], run_config["task_name"]
+            )
+            task_manager.enqueue_task(task_id, queue["id"])
+            queue_manager.record_enqueue(task_id, queue["id"])
+            report.update(status="ok", task_id=task_id)
+        except Exception as e:
+            report.update(status="error", error=str(e))
+        report["latency_sec"] = round(time.monotonic() - start, 3)
+        return report
+
+    return submit_concurrently(submit, run_configs, concurrency)
+
+
+# Call submit(index, item) for every item through a pool of `concurrency` threads. submit
+# returns a report dict, with a "status" of "ok" or "error", which is printed as a JSON
+# line as soon as it's available. Return the number of failed submissions.
+def submit_concurrently(submit, items, concurrency):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(submit, index, item) for index, item in enumerate(items)
+        ]
+        for future in as_completed(futures):
+            report = future.result()
+            if report["status"] != "ok":
+                failures += 1
+            click.echo(json.dumps(report))
+    return failures
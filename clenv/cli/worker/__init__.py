@@ -0,0 +1 @@
+import click
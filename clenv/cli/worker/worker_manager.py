@@ -0,0 +1,172 @@
+from clenv.cli.cache import get_cache_file_path, read_cache_file, write_cache_file
+from clenv.cli.config.config_loader import ConfigLoader
+from clenv.cli.api_client import ApiClient
+import hashlib
+
+
+# Worker operations sent straight to the ClearML API, on the same session as the
+# QueueManager
+class WorkerManager:
+    # The utilisation metrics of the workers, in percent
+    METRICS = ["cpu_usage", "gpu_usage"]
+
+    def __init__(self):
+        self.__config_loader = ConfigLoader()
+        self.__config_loader.load()
+        self.__api = ApiClient(self.__config_loader)
+
+    def get_workers(self, last_seen=3600):
+        """
+        Get the workers active in the last last_seen seconds, as dicts with the id, the
+        queues and the current task of the worker among others
+        """
+        return self.__api.send_request("workers.get_all", {"last_seen": last_seen})[
+            "workers"
+        ]
+
+    def get_utilization_series(self, worker_ids, from_date, to_date, interval):
+        """
+        Get the average utilisation of the workers per interval between the dates, in
+        seconds from epoch, as a dict of worker id to a dict of metric to a dict with the
+        "dates" and the "values" of the series. Workers without data are left out.
+
+        The series are cached locally. A window already fetched less than an interval
+        ago is not fetched again, and only the points after the cached ones are fetched
+        for a window overlapping the cached one.
+        """
+        # The windows are aligned on the interval, so that the points of a repeated
+        # query are the ones of the cache
+        from_date = from_date // interval * interval
+        worker_ids = sorted(worker_ids)
+        cache_key = hashlib.sha1(
+            f"{self.__api.session.host} {interval}".encode("utf-8")
+        ).hexdigest()[:16]
+        cache_file_path = get_cache_file_path(f"worker-stats-{cache_key}.json")
+
+        series = {}
+        fetch_from = from_date
+        cache = read_cache_file(cache_file_path)
+        if (
+            cache is not None
+            and cache["worker_ids"] == worker_ids
+            and cache["from_date"] <= from_date < cache["to_date"]
+        ):
+            if to_date - cache["to_date"] < interval:
+                return self.__trim_series(cache["series"], from_date)
+            series = cache["series"]
+            # The last cached point may have been a partial interval, it's fetched again
+            fetch_from = cache["to_date"] // interval * interval
+
+        resp = self.__api.send_request(
+            "workers.get_stats",
+            {
+                "worker_ids": worker_ids,
+                "from_date": fetch_from,
+                "to_date": to_date,
+                "interval": interval,
+                "items": [
+                    {"key": metric, "category": "avg"} for metric in self.METRICS
+                ],
+            },
+        )
+        series = self.__trim_series(series, from_date, until_date=fetch_from)
+        for worker_stats in resp.get("workers") or []:
+            for metric_stats in worker_stats.get("metrics") or []:
+                values = (metric_stats.get("stats") or [{}])[0].get("values") or []
+                if not values:
+                    continue
+                metric_series = series.setdefault(
+                    worker_stats["worker"], {}
+                ).setdefault(metric_stats["metric"], {"dates": [], "values": []})
+                metric_series["dates"] += metric_stats["dates"]
+                metric_series["values"] += values
+
+        write_cache_file(
+            cache_file_path,
+            {
+                "worker_ids": worker_ids,
+                "from_date": from_date,
+                "to_date": to_date,
+                "series": series,
+            },
+        )
+        return series
+
+    # Keep the points of the series from from_date, and before until_date if given
+    def __trim_series(self, series, from_date, until_date=None):
+        trimmed = {}
+        for worker_id, metrics in series.items():
+            for metric, metric_series in metrics.items():
+                points = [
+                    (date, value)
+                    for date, value in zip(
+                        metric_series["dates"], metric_series["values"]
+                    )
+                    if date >= from_date and (until_date is None or date < until_date)
+                ]
+                if points:
+                    dates, values = zip(*points)
+                    trimmed.setdefault(worker_id, {})[metric] = {
+                        "dates": list(dates),
+                        "values": list(values),
+                    }
+        return trimmed
+
+
+# Aggregate the utilisation series of the workers per queue. A worker serving several
+# queues counts in each of them. Return a dict of queue name to a dict with the number of
+# workers, the mean and p95 of the CPU and GPU usage, and the idle minutes of the workers,
+# the intervals in which their usage was below idle_threshold percent. The usage is the
+# GPU one for the workers reporting it, the CPU one otherwise.
+def aggregate_utilization(
+    workers, series, from_date, to_date, interval, idle_threshold=5.0
+):
+    import numpy as np
+
+    from_date = from_date // interval * interval
+    num_points = max(int((to_date - from_date) // interval) + 1, 1)
+    worker_ids = [worker["id"] for worker in workers]
+
+    # A matrix per metric, with a row per worker and a column per interval, NaN where the
+    # worker reported nothing
+    usage = {}
+    for metric in WorkerManager.METRICS:
+        matrix = np.full((len(worker_ids), num_points), np.nan)
+        for row, worker_id in enumerate(worker_ids):
+            metric_series = series.get(worker_id, {}).get(metric)
+            if not metric_series:
+                continue
+            columns = (np.asarray(metric_series["dates"]) - from_date) // interval
+            values = np.asarray(metric_series["values"], dtype=float)
+            in_window = (columns >= 0) & (columns < num_points)
+            matrix[row, columns[in_window].astype(int)] = values[in_window]
+        usage[metric] = matrix
+
+    reports_gpu = ~np.isnan(usage["gpu_usage"]).all(axis=1)
+    primary_usage = np.where(
+        reports_gpu[:, None], usage["gpu_usage"], usage["cpu_usage"]
+    )
+    idle_minutes = (primary_usage < idle_threshold).sum(axis=1) * interval / 60
+
+    rows_by_queue = {}
+    for row, worker in enumerate(workers):
+        for queue in worker.get("queues") or []:
+            rows_by_queue.setdefault(queue["name"], []).append(row)
+
+    summaries = {}
+    for queue_name, rows in sorted(rows_by_queue.items()):
+        rows = np.asarray(rows)
+        summary = {
+            "workers": len(rows),
+            "idle_minutes": float(idle_minutes[rows].sum()),
+        }
+        for metric in WorkerManager.METRICS:
+            values = usage[metric][rows]
+            values = values[~np.isnan(values)]
+            prefix = metric.split("_")[0]
+            summary[f"{prefix}_mean"] = float(values.mean()) if values.size else None
+            summary[f"{prefix}_p95"] = (
+                float(np.percentile(values, 95)) if values.size else None
+            )
+        summaries[queue_name] = summary
+    return summaries
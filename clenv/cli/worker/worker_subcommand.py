@@ -0,0 +1,123 @@
+import click
+import re
+
+# Write a subcommand about the worker management
+# The ClearML SDK and numpy are heavy to import, so they are imported inside the commands
+
+
+@click.group(help="Worker management")
+def worker():
+    pass
+
+
+@worker.command(help="List the workers active recently, with their queues and task")
+@click.option(
+    "--last-seen",
+    default=3600,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Only list the workers active in the last seconds",
+)
+def list(last_seen):
+    from clenv.cli.worker.worker_manager import WorkerManager
+
+    workers = WorkerManager().get_workers(last_seen)
+    if not workers:
+        click.echo("No active workers", err=True)
+        return
+
+    rows = [
+        [
+            worker["id"],
+            ",".join(queue["name"] for queue in worker.get("queues") or []),
+            (worker.get("task") or {}).get("name") or "idle",
+        ]
+        for worker in sorted(workers, key=lambda worker: worker["id"])
+    ]
+    print_table(["WORKER", "QUEUES", "TASK"], rows)
+
+
+@worker.command(
+    help="Show the CPU and GPU utilisation of the workers, aggregated per queue. \n\n"
+    + "The idle minutes are the time the workers used less than --idle-threshold percent "
+    + "of their GPUs, or of their CPU for the workers without GPU. The utilisation "
+    + "series are cached locally, so a repeated query over the same window does not "
+    + "download them again."
+)
+@click.option(
+    "--window",
+    default="1h",
+    show_default=True,
+    help="The period to aggregate, up to now, e.g. 30m, 6h or 2d",
+)
+@click.option(
+    "--interval",
+    type=click.IntRange(min=1),
+    help="Seconds per point of the utilisation series. Defaults to the window divided "
+    + "in 100 points, and at least 60",
+)
+@click.option(
+    "--idle-threshold",
+    default=5.0,
+    show_default=True,
+    type=click.FloatRange(min=0, max=100),
+    help="Utilisation percent under which a worker is idle",
+)
+def stats(window, interval, idle_threshold):
+    from clenv.cli.worker.worker_manager import WorkerManager, aggregate_utilization
+    import time
+
+    window_sec = parse_window(window)
+    if interval is None:
+        interval = max(60, window_sec // 100)
+    worker_manager = WorkerManager()
+    workers = worker_manager.get_workers(last_seen=window_sec)
+    if not workers:
+        click.echo("No workers active in the window", err=True)
+        return
+
+    to_date = int(time.time())
+    from_date = to_date - window_sec
+    series = worker_manager.get_utilization_series(
+        [worker["id"] for worker in workers], from_date, to_date, interval
+    )
+    summaries = aggregate_utilization(
+        workers, series, from_date, to_date, interval, idle_threshold
+    )
+
+    def percent(value):
+        return "-" if value is None else f"{value:.0f}%"
+
+    rows = [
+        [
+            queue_name,
+            str(summary["workers"]),
+            percent(summary["cpu_mean"]),
+            percent(summary["cpu_p95"]),
+            percent(summary["gpu_mean"]),
+            percent(summary["gpu_p95"]),
+            f"{summary['idle_minutes']:.0f}",
+        ]
+        for queue_name, summary in summaries.items()
+    ]
+    print_table(
+        ["QUEUE", "WORKERS", "CPU MEAN", "CPU P95", "GPU MEAN", "GPU P95", "IDLE MIN"],
+        rows,
+    )
+
+
+# Parse a window such as 30m, 6h or 2d to seconds
+def parse_window(window):
+    match = re.fullmatch(r"(\d+)([smhd])", window.strip())
+    if match is None:
+        raise click.BadParameter(
+            f"{window} is not a number followed by s, m, h or d", param_hint="--window"
+        )
+    unit_sec = {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+    return int(match.group(1)) * unit_sec
+
+
+def print_table(headers, rows):
+    widths = [max(len(row[i]) for row in [headers] + rows) for i in range(len(headers))]
+    for row in [headers] + rows:
+        click.echo("  ".join(value.ljust(width) for value, width in zip(row, widths)))
@@ -0,0 +1,131 @@
+# Check of the profile file moves done by ConfigManager in the home directory.
+#
+# The ConfigManager moves the profile config files from the home directory to the
+# profile directory on the first run, and can replace ~/clearml.conf with a symlink to
+# the active profile's file. This script runs these steps with HOME pointed at a temp
+# directory and fails if a file ends up in the wrong place:
+# - the one-time migration moves clearml-<profile_name>.conf to ~/.clenv/profiles, and
+#   leaves the clearml-server-<username>.conf files of `clenv user genpass` alone
+# - switching by symlink turns the renamed ~/clearml.conf into a symlink to the file of
+#   the active profile in the profile directory
+# - renaming the active profile renames its file and points the symlink to it
+#
+# Usage: python config_migration_check.py
+import os
+import sys
+import tempfile
+
+CLEARML_CONF = """
+api {
+    api_server: "http://localhost:%d"
+}
+"""
+
+
+def write_config(file_path, port):
+    with open(file_path, "w") as f:
+        f.write(CLEARML_CONF % port)
+
+
+def read_config(file_path):
+    with open(file_path) as f:
+        return f.read()
+
+
+def check(condition, message):
+    if not condition:
+        print(f"FAIL: {message}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as home_dir:
+        # ConfigManager expands ~ when it's called, so HOME is set before it's used
+        os.environ["HOME"] = home_dir
+        from clenv.cli.config.config_manager import ConfigManager
+
+        index_file_path = os.path.join(home_dir, ".clenv-config-index.json")
+        active_file_path = os.path.join(home_dir, "clearml.conf")
+        profile_dir = os.path.join(home_dir, ".clenv", "profiles")
+        write_config(active_file_path, 8000)
+        write_config(os.path.join(home_dir, "clearml-dev.conf"), 8001)
+        write_config(os.path.join(home_dir, "clearml-server-alice.conf"), 8002)
+
+        # The one-time migration
+        config_manager = ConfigManager(index_file_path)
+        check(
+            os.path.isfile(os.path.join(profile_dir, "clearml-dev.conf")),
+            "clearml-dev.conf is not moved to the profile directory",
+        )
+        check(
+            not os.path.exists(os.path.join(home_dir, "clearml-dev.conf")),
+            "clearml-dev.conf is left in the home directory",
+        )
+        check(
+            os.path.isfile(os.path.join(home_dir, "clearml-server-alice.conf")),
+            "clearml-server-alice.conf is moved out of the home directory",
+        )
+        check(
+            not os.path.exists(os.path.join(profile_dir, "clearml-server-alice.conf")),
+            "clearml-server-alice.conf is migrated as a profile",
+        )
+        check(
+            [p["profile_name"] for p in config_manager.get_all_profiles()]
+            == ["untitled", "dev"],
+            "the migrated profiles are not indexed",
+        )
+
+        # Rename the active profile, then switch by symlink
+        config_manager.initialize_profile("main")
+        check(
+            os.path.isfile(active_file_path) and not os.path.islink(active_file_path),
+            "renaming the active profile moved ~/clearml.conf",
+        )
+        config_manager.set_active_profile("dev", symlink=True)
+        config_manager.save_index()
+        main_file_path = os.path.join(profile_dir, "clearml-main.conf")
+        dev_file_path = os.path.join(profile_dir, "clearml-dev.conf")
+        check(os.path.islink(active_file_path), "~/clearml.conf is not a symlink")
+        check(
+            os.path.realpath(active_file_path) == os.path.realpath(dev_file_path),
+            "~/clearml.conf doesn't point to the dev profile",
+        )
+        check(
+            os.path.isfile(main_file_path) and "8000" in read_config(main_file_path),
+            "the previous active config is not kept in the profile directory",
+        )
+
+        # A new ConfigManager finds the active profile through the symlink
+        config_manager = ConfigManager(index_file_path)
+        check(
+            config_manager.get_active_profile()[0]["profile_name"] == "dev",
+            "the symlinked profile is not the active one after a rescan",
+        )
+
+        # Rename the symlinked active profile
+        config_manager.rename_profile("dev", "staging")
+        config_manager.save_index()
+        staging_file_path = os.path.join(profile_dir, "clearml-staging.conf")
+        check(
+            not os.path.exists(dev_file_path)
+            and "8001" in read_config(staging_file_path),
+            "the active profile's file is not renamed",
+        )
+        check(
+            os.path.realpath(active_file_path) == os.path.realpath(staging_file_path),
+            "~/clearml.conf doesn't point to the renamed file",
+        )
+        config_manager = ConfigManager(index_file_path)
+        check(
+            config_manager.get_active_profile()[0]["profile_name"] == "staging",
+            "the renamed profile is not the active one after a rescan",
+        )
+
+        # Switching back by symlink keeps ~/clearml.conf a symlink
+        config_manager.set_active_profile("main")
+        check(
+            os.path.islink(active_file_path)
+            and os.path.realpath(active_file_path) == os.path.realpath(main_file_path),
+            "switching back doesn't repoint the symlink",
+        )
+    print("OK")
@@ -0,0 +1,139 @@
+# Check of GitReader against git itself.
+#
+# GitReader reads the branch, the commit and the remote URL of a task from the files of
+# the .git directory instead of running git. This script builds throwaway repos in a
+# temp directory, in the layouts GitReader has to handle, and fails if what it reads
+# differs from what git reports:
+# - loose refs, packed refs, and a detached HEAD
+# - a branch without commits yet
+# - a remote URL in a quoted value followed by a comment
+# - a linked worktree, whose .git is a file and whose refs are in the main repo
+# - whether a commit is on a remote branch, as the tip or as an ancestor
+#
+# Usage: python git_reader_check.py
+import os
+import subprocess
+import sys
+import tempfile
+
+from clenv.cli.task.git_reader import GitReader
+
+REMOTE_URL = "git@example.com:team/project.git"
+
+
+def git(repo_dir, *args):
+    return subprocess.run(
+        ["git", "-C", repo_dir] + list(args),
+        check=True,
+        capture_output=True,
+        text=True,
+        env=dict(
+            os.environ,
+            GIT_AUTHOR_NAME="clenv",
+            GIT_AUTHOR_EMAIL="clenv@example.com",
+            GIT_COMMITTER_NAME="clenv",
+            GIT_COMMITTER_EMAIL="clenv@example.com",
+        ),
+    ).stdout.strip()
+
+
+def commit(repo_dir, message):
+    git(repo_dir, "commit", "--allow-empty", "-q", "-m", message)
+    return git(repo_dir, "rev-parse", "HEAD")
+
+
+def check(condition, message):
+    if not condition:
+        print(f"FAIL: {message}")
+        sys.exit(1)
+
+
+def check_head(repo_dir, expected, message):
+    head = GitReader(repo_dir).get_head()
+    check(head == expected, f"{message}: {head} != {expected}")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo_dir = os.path.join(tmp_dir, "repo")
+        os.makedirs(repo_dir)
+        git(repo_dir, "init", "-q", "-b", "main")
+
+        # A branch without commits yet
+        check_head(repo_dir, ("main", None), "unborn branch")
+
+        # Loose refs, then packed refs
+        first_commit = commit(repo_dir, "first")
+        check_head(repo_dir, ("main", first_commit), "loose ref")
+        git(repo_dir, "pack-refs", "--all")
+        check(
+            not os.path.exists(os.path.join(repo_dir, ".git", "refs", "heads", "main")),
+            "the refs are not packed",
+        )
+        check_head(repo_dir, ("main", first_commit), "packed ref")
+        second_commit = commit(repo_dir, "second")
+        check_head(repo_dir, ("main", second_commit), "loose ref over a packed one")
+        git(repo_dir, "checkout", "-q", "-b", "feature/x")
+        check_head(repo_dir, ("feature/x", second_commit), "branch with a slash")
+
+        # A detached HEAD
+        git(repo_dir, "checkout", "-q", "--detach", first_commit)
+        check_head(repo_dir, (None, first_commit), "detached HEAD")
+        git(repo_dir, "checkout", "-q", "main")
+
+        # The remote URL, written the way git itself doesn't, but may be found in a
+        # config edited by hand
+        check(GitReader(repo_dir).get_remote_url() is None, "remote before added")
+        with open(os.path.join(repo_dir, ".git", "config"), "a") as f:
+            f.write(
+                '[remote "upstream"]\n\turl = https://example.com/upstream.git\n'
+                f'[Remote "origin"]\n\tURL = "{REMOTE_URL}" ; the main remote\n'
+            )
+        for remote in ("origin", "upstream"):
+            expected = git(repo_dir, "config", "--get", f"remote.{remote}.url")
+            remote_url = GitReader(repo_dir).get_remote_url(remote)
+            check(
+                remote_url == expected, f"remote {remote}: {remote_url} != {expected}"
+            )
+
+        # Whether a commit is pushed, from the remote-tracking refs
+        git(repo_dir, "update-ref", "refs/remotes/origin/main", first_commit)
+        git_reader = GitReader(repo_dir)
+        check(git_reader.is_pushed(first_commit) is True, "tip of a loose remote ref")
+        check(git_reader.is_pushed(second_commit) is False, "commit not pushed")
+        git(repo_dir, "pack-refs", "--all")
+        check(git_reader.is_pushed(first_commit) is True, "tip of a packed remote ref")
+        git(repo_dir, "update-ref", "refs/remotes/origin/main", second_commit)
+        check(git_reader.is_pushed(first_commit) is True, "ancestor of a remote ref")
+        check(
+            git_reader.is_pushed(first_commit, "upstream") is False,
+            "commit pushed to another remote",
+        )
+
+        # A linked worktree
+        worktree_dir = os.path.join(tmp_dir, "worktree")
+        git(repo_dir, "worktree", "add", "-q", "-b", "wt", worktree_dir, first_commit)
+        check(
+            os.path.isfile(os.path.join(worktree_dir, ".git")),
+            "the .git of the worktree is not a file",
+        )
+        check_head(worktree_dir, ("wt", first_commit), "linked worktree")
+        third_commit = commit(worktree_dir, "third")
+        check_head(worktree_dir, ("wt", third_commit), "commit in a linked worktree")
+        check_head(repo_dir, ("main", second_commit), "main repo of a worktree")
+        check(
+            GitReader(worktree_dir).get_remote_url() == REMOTE_URL,
+            "remote of a linked worktree",
+        )
+        check(
+            GitReader(worktree_dir).is_pushed(first_commit) is True,
+            "pushed commit in a linked worktree",
+        )
+
+        # Not a repository
+        try:
+            GitReader(tmp_dir)
+            check(False, "a directory without .git is read as a repository")
+        except Exception as e:
+            check("is not the root of a git repository" in str(e), str(e))
+    print("OK")
@@ -0,0 +1,82 @@
+# Import-time regression check for the `clenv config` commands.
+#
+# `clenv config checkout` is called from shell hooks and CI steps, so its cold start
+# must not pay for the task tooling (ClearML SDK, GitPython, InquirerPy). This script
+# runs `clenv config list` in fresh interpreters, with HOME pointed at a temp directory
+# holding a minimal clearml.conf, and fails if any of the heavy modules gets imported,
+# or if the median cold start exceeds the time budget.
+#
+# Usage: python import_time_check.py [budget_ms]
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Budget for the cold start of `clenv config`, on top of a bare interpreter start
+DEFAULT_BUDGET_MS = 250
+RUNS = 5
+FORBIDDEN_MODULES = ["clearml", "git", "InquirerPy", "requests"]
+CLEARML_CONF = """
+api {
+    web_server: "http://localhost:8080"
+    api_server: "http://localhost:8008"
+    files_server: "http://localhost:8081"
+    credentials {
+        access_key: "key"
+        secret_key: "secret"
+    }
+}
+"""
+
+PROBE = """
+import sys
+from click.testing import CliRunner
+from clenv.cli.__main__ import clenv
+
+result = CliRunner().invoke(clenv, ["config", "list"])
+assert result.exit_code == 0, result.output
+print(",".join(sorted({m.split(".")[0] for m in sys.modules})))
+"""
+
+
+def median_runtime_ms(args, env=None):
+    timings = []
+    output = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        output = subprocess.run(
+            args, check=True, capture_output=True, text=True, env=env
+        ).stdout
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], output
+
+
+if __name__ == "__main__":
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MS
+
+    with tempfile.TemporaryDirectory() as home_dir:
+        with open(os.path.join(home_dir, "clearml.conf"), "w") as f:
+            f.write(CLEARML_CONF)
+        env = dict(os.environ, HOME=home_dir)
+        # The first run creates the profile index, the measured runs read it, as the
+        # commands called from shell hooks do
+        subprocess.run(
+            [sys.executable, "-c", PROBE], check=True, capture_output=True, env=env
+        )
+        baseline_ms, _ = median_runtime_ms([sys.executable, "-c", "pass"], env)
+        config_ms, output = median_runtime_ms([sys.executable, "-c", PROBE], env)
+    imported = set(output.strip().split(","))
+
+    leaked = [name for name in FORBIDDEN_MODULES if name in imported]
+    overhead_ms = config_ms - baseline_ms
+    print(f"clenv config cold start: {overhead_ms:.0f}ms (budget {budget_ms:.0f}ms)")
+
+    if leaked:
+        print(f"FAIL: heavy modules imported by `clenv config`: {leaked}")
+        sys.exit(1)
+    if overhead_ms > budget_ms:
+        print("FAIL: cold start exceeds the budget")
+        sys.exit(1)
+    print("OK")
@@ -35,7 +35,8 @@ setup(
         "click>=8.1.0",
         "pyhocon==0.3.35",
         "bcrypt>=4.0.0",
-        "GitPython==3.1.31",
         "inquirerpy==0.3.4",
+        "PyYAML>=5.1",
+        "numpy>=1.17",
     ],
 )
@@ -0,0 +1,120 @@
+# Check of the claims of SubmissionSpool.
+#
+# exec and `clenv task spool flush` may send the spooled submissions concurrently, and a
+# process may die while it sends one. This script runs the spool in a temp directory and
+# fails if an entry could be sent twice, or could be lost:
+# - an entry is claimed by a single process, and the claim is reported as "flushing"
+# - a released entry is pending again, with its attempts and error recorded
+# - the claim of a dead process is released, the claim of a live one is kept
+# - the claim of another host is released only once it's older than the timeout
+#
+# Usage: python submission_spool_check.py
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+from clenv.cli.cache import read_cache_file, write_cache_file
+from clenv.cli.task.submission_spool import SubmissionSpool
+
+PROCESSES = 8
+
+
+def check(condition, message):
+    if not condition:
+        print(f"FAIL: {message}")
+        sys.exit(1)
+
+
+def get_states(spool):
+    return {entry["id"]: entry["state"] for entry in spool.get_entries()}
+
+
+def claim_in_process(args):
+    spool_dir, entry_id = args
+    return SubmissionSpool(spool_dir).claim(entry_id) is not None
+
+
+# Rewrite the owner of a claimed entry, as if another process claimed it
+def set_owner(spool_dir, entry_id, owner):
+    file_path = os.path.join(spool_dir, entry_id + SubmissionSpool.CLAIMED_SUFFIX)
+    entry = read_cache_file(file_path)
+    entry["owner"] = owner
+    write_cache_file(file_path, entry)
+    return file_path
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as spool_dir:
+        spool = SubmissionSpool(spool_dir)
+        check(spool.get_entries() == [], "entries before any is added")
+        first_id = spool.add({"task_name": "first"})
+        second_id = spool.add({"task_name": "second"})
+        check(
+            [entry["id"] for entry in spool.get_entries()] == [first_id, second_id],
+            "the entries are not in the order they were added",
+        )
+
+        # A single claim wins, even between processes
+        with Pool(PROCESSES) as pool:
+            claimed = pool.map(claim_in_process, [(spool_dir, first_id)] * PROCESSES)
+        check(claimed.count(True) == 1, f"{claimed.count(True)} claims of an entry")
+        check(spool.claim(first_id) is None, "a claimed entry is claimed again")
+
+        # The pool processes exited, so their claim is released
+        check(
+            get_states(spool) == {first_id: "pending", second_id: "pending"},
+            "the claim of an exited pool process is not released",
+        )
+
+        # Release and update
+        entry = spool.claim(first_id)
+        check(entry["owner"]["pid"] == os.getpid(), "the owner is not recorded")
+        entry["task_id"] = "task-1"
+        spool.update(entry)
+        check(
+            get_states(spool) == {first_id: "flushing", second_id: "pending"},
+            "the live claim is not flushing",
+        )
+        spool.release(entry, "server unreachable")
+        entry = [e for e in spool.get_entries() if e["id"] == first_id][0]
+        check(entry["state"] == "pending", "the released entry is not pending")
+        check(entry["attempts"] == 1, "the attempt is not counted")
+        check(entry["last_error"] == "server unreachable", "the error is not kept")
+        check(entry["task_id"] == "task-1", "the update is lost by the release")
+        check("owner" not in entry, "the owner is kept by the release")
+
+        # The claim of a process that exited
+        spool.claim(first_id)
+        dead_process = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead_process.wait()
+        set_owner(
+            spool_dir, first_id, {"pid": dead_process.pid, "host": socket.gethostname()}
+        )
+        check(
+            get_states(spool)[first_id] == "pending",
+            "the claim of an exited process is not released",
+        )
+
+        # The claim of another host, recent then older than the timeout
+        spool.claim(second_id)
+        file_path = set_owner(spool_dir, second_id, {"pid": 1, "host": "other-host"})
+        check(
+            get_states(spool)[second_id] == "flushing",
+            "the recent claim of another host is released",
+        )
+        old_time = time.time() - SubmissionSpool.CLAIM_TIMEOUT_SEC - 1
+        os.utime(file_path, (old_time, old_time))
+        check(
+            get_states(spool)[second_id] == "pending",
+            "the stale claim of another host is not released",
+        )
+
+        # Remove the sent entries
+        for entry_id in (first_id, second_id):
+            spool.remove(spool.claim(entry_id))
+        check(spool.get_entries() == [], "the sent entries are not removed")
+    print("OK")